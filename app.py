@@ -5,7 +5,7 @@ import os
 import dash
 from dash import Input, Output, State, dcc, html, no_update
 from dotenv import load_dotenv
-from flask import Flask, session
+from flask import Flask, Response, session
 from flask_login import (
     LoginManager,
     UserMixin,
@@ -15,6 +15,8 @@ from flask_login import (
 
 from config import settings
 from src.data_functions import create_fy_options, get_marks
+from src.data_store import STORE
+from src.query_cache import format_stats
 from src.version import version
 
 load_dotenv()
@@ -26,15 +28,6 @@ FY_OPTIONS = create_fy_options()
 server = Flask(__name__)
 server.config["MAX_LOGIN_ATTEMPTS"] = 3
 
-if settings["DEBUG_MODE"]:
-    # Cache setup
-    config = {
-        "CACHE_TYPE": "FileSystemCache",
-        "CACHE_DEFAULT_TIMEOUT": 31536000,  # arbitrarily long cache time
-        "CACHE_DIR": "cache",
-    }
-    server.config.from_mapping(config)
-
 app = dash.Dash(
     __name__,
     server=server,
@@ -60,6 +53,13 @@ login_manager.login_view = "/login"
 login_manager.session_protection = "strong"
 
 
+@server.route("/metrics")
+def metrics():
+    # counters of the worker that answers, each gunicorn worker has its own cache
+    stats = STORE.query_cache.stats() if STORE.query_cache is not None else {}
+    return Response(format_stats(stats, os.getpid()), mimetype="text/plain")
+
+
 class User(UserMixin):
     def __init__(self, username):
         self.id = username
@@ -177,17 +177,18 @@ for page in dash.page_registry.values():
     logging.debug((f"{page['name']} - {page['path']}"))
 
 
-@app.callback(
+# menu and filter toggles only change the page, so they run in the browser
+app.clientside_callback(
+    """
+    function toggle_menu(n_clicks) {
+        const className = "s-header navbar navbar-dark navbar-expand-md flex-nav";
+        // show on odd clicks, hide otherwise
+        return n_clicks % 2 === 1 ? className + " show-nav" : className;
+    }
+    """,
     Output("navbar-content", "className"),
     Input("hamburger-button", "n_clicks"),
 )
-def toggle_menu(n_clicks):
-    if n_clicks is not None and n_clicks % 2 == 1:
-        # show
-        return "s-header navbar navbar-dark navbar-expand-md flex-nav show-nav"
-    else:
-        # hide
-        return "s-header navbar navbar-dark navbar-expand-md flex-nav"
 
 
 @app.callback(
@@ -220,62 +221,40 @@ def update_authentication_status(_):
     )
 
 
-@app.callback(
+app.clientside_callback(
+    """
+    function toggle_filters(click, state) {
+        if (state && state.display === "none") {
+            return [{"display": ""}, "bi bi-chevron-down filter-toggle__chevron"];
+        }
+        return [{"display": "none"}, "bi bi-chevron-up filter-toggle__chevron"];
+    }
+    """,
     Output("filters", "style"),
     Output("chevron-icon", "className"),
     Input("toggle-filters", "n_clicks"),
     State("filters", "style"),
     prevent_initial_call=True,
 )
-def toggle_filters(click, state):
-    if state == {"display": "none"}:
-        return {
-            "display": "",
-        }, "bi bi-chevron-down filter-toggle__chevron"
-    else:
-        return {"display": "none"}, "bi bi-chevron-up filter-toggle__chevron"
-
-
-@app.callback(
-    Output("select_institutions_dd", "value"),
-    Input("select_institutions_dd", "value"),
-    [State("select_institutions_dd", "options")],
-)
-def select_all_none_inst(selected, possible):
-    opts = []
-    if "All" in selected:
-        opts = possible
-    else:
-        opts = selected
-    return opts
-
-
-@app.callback(
-    Output("select_machine_dd", "value"),
-    Input("select_machine_dd", "value"),
-    [State("select_machine_dd", "options")],
-)
-def select_all_none_machine(selected, possible):
-    opts = []
-    if "All" in selected:
-        opts = possible
-    else:
-        opts = selected
-    return opts
 
-
-@app.callback(
-    Output("select-machine-dd", "value"),
-    Input("select-machine-dd", "value"),
-    [State("select-machine-dd", "options")],
-)
-def select_all_none_machine_2(selected, possible):
-    opts = []
-    if "All" in selected:
-        opts = possible
-    else:
-        opts = selected
-    return opts
+# Picking "All" selects every other option. The figure callbacks skip values
+# holding "All", so they only run once, for the expanded selection.
+SELECT_ALL_NONE = """
+function select_all_none(selected, possible) {
+    if (!selected || !selected.includes("All")) {
+        return window.dash_clientside.no_update;
+    }
+    return possible.filter((option) => option !== "All");
+}
+"""
+
+for dropdown_id in ["select_institutions_dd", "select_machine_dd", "select-machine-dd"]:
+    app.clientside_callback(
+        SELECT_ALL_NONE,
+        Output(dropdown_id, "value"),
+        Input(dropdown_id, "value"),
+        State(dropdown_id, "options"),
+    )
 
 
 @app.callback(
@@ -325,4 +304,5 @@ def auth_button_click(n_clicks_login, username, password):
 
 
 if __name__ == "__main__":
+    STORE.start_watcher()
     app.run(host="0.0.0.0", debug=settings["DEBUG_MODE"])
@@ -0,0 +1,81 @@
+"""Compares building the institution bar graphs with plotly express against
+the figure dicts make_bar_figure builds, including their JSON encoding.
+
+    python -m benchmarks.bench_bar_graph --years 1 --rows 3000
+"""
+
+import argparse
+import json
+import time
+
+import plotly
+import plotly.express as px
+
+from benchmarks.synthetic import (
+    INSTITUTIONS,
+    MACHINES,
+    get_synthetic_months,
+    make_monthly_frames,
+)
+from src.data_functions import materialize_worksheet
+from src.metric_cube import (
+    MetricTensor,
+    build_cube,
+    calc_cube_monthly_avgs,
+    calc_cube_node_monthly_sums,
+)
+from src.ui_functions import INSTITUTION_ORDER, make_bar_figure, make_color_map
+
+
+def make_px_bar_figure(df, yaxis, colors, ytitle=None, hover=None):
+    # the px.bar figure make_bar_graph built before make_bar_figure
+    fig = px.bar(
+        data_frame=df,
+        x="Institution",
+        y=yaxis,
+        color="Date",
+        barmode="group",
+        color_discrete_map=colors,
+        text_auto=True,
+        hover_data=[hover],
+        category_orders={"Institution": INSTITUTION_ORDER},
+    )
+    if ytitle:
+        fig.update_layout(yaxis_title=ytitle)
+    return fig
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=int, default=1)
+    parser.add_argument("--rows", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    df = materialize_worksheet(make_monthly_frames(args.years, args.rows))
+    tensor = MetricTensor(build_cube(df))
+    dates = get_synthetic_months(args.years)
+    colors = make_color_map(dates)
+    charts = [
+        ("allocations", calc_cube_monthly_avgs, "Count", "Number", "Resource"),
+        ("usage", calc_cube_node_monthly_sums, "SU's Charged", None, "Resource"),
+    ]
+    for name, func, yaxis, ytitle, hover in charts:
+        aggregated = func(tensor, INSTITUTIONS, dates, MACHINES)
+        results = []
+        for label, build in [("px", make_px_bar_figure), ("dict", make_bar_figure)]:
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                fig = build(aggregated, yaxis, colors, ytitle, hover)
+                payload = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+            elapsed = (time.perf_counter() - start) / args.repeat
+            print(
+                f"{name:>12} {label:>4}: {elapsed * 1000:8.2f} ms, "
+                f"{len(payload) / 1024:6.1f} KB"
+            )
+            results.append(json.loads(payload))
+        assert results[0] == results[1]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Compares row-by-row institution normalization against clean_df.
+
+python -m benchmarks.bench_clean_df
+"""
+
+import argparse
+import time
+
+import pandas as pd
+
+import src.data_functions
+from benchmarks.synthetic import make_raw_user_sheet
+from src.constants import COLUMN_HEADERS, INSTITUTIONS
+from src.data_functions import clean_df, fuzzy_match_institution
+
+
+def clean_df_by_row(df):
+    # clean_df before institution names were normalized per distinct name
+    df.rename(columns=COLUMN_HEADERS, inplace=True)
+    df.dropna(subset="Institution", inplace=True)
+    s = pd.Series([x for x in range(df.shape[0])])
+    df.set_index(s, inplace=True)
+    for i in range(df.shape[0]):
+        try:
+            df.loc[i, "Institution"] = INSTITUTIONS[df.loc[i, "Institution"]]
+        except KeyError:
+            df.loc[i, "Institution"] = fuzzy_match_institution(df.loc[i, "Institution"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    args = parser.parse_args()
+
+    raw = make_raw_user_sheet(args.rows)
+    results = {}
+    for name, func in [("row by row", clean_df_by_row), ("clean_df", clean_df)]:
+        src.data_functions.INSTITUTION_ALIASES.clear()
+        df = raw.copy()
+        start = time.perf_counter()
+        func(df)
+        print(f"{name:>10}: {(time.perf_counter() - start) * 1000:8.1f} ms")
+        results[name] = df
+    assert results["row by row"]["Institution"].equals(
+        results["clean_df"]["Institution"]
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Compares filter_df against filter_sorted_df for selections of growing size.
+
+python -m benchmarks.bench_filter_df --years 6 --rows 3000
+"""
+
+import argparse
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import (
+    INSTITUTIONS,
+    MACHINES,
+    get_synthetic_months,
+    make_monthly_frames,
+)
+from src.data_functions import (
+    filter_df,
+    filter_sorted_df,
+    materialize_worksheet,
+    sort_worksheet,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=int, default=6)
+    parser.add_argument("--rows", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    df = materialize_worksheet(make_monthly_frames(args.years, args.rows))
+    sorted_df, keys = sort_worksheet(df)
+    months = get_synthetic_months(args.years)
+    print(f"{len(df)} rows, {len(months)} months")
+    selections = [
+        ("1 institution, 1 month", INSTITUTIONS[:1], months[-1:]),
+        ("all, 1 fiscal year", INSTITUTIONS, months[-12:]),
+        ("all, all months", INSTITUTIONS, months),
+    ]
+    for name, institutions, date_range in selections:
+        results = []
+        for func, args_ in [
+            (filter_df, (df,)),
+            (filter_sorted_df, (sorted_df, keys)),
+        ]:
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                result = func(*args_, institutions, date_range, MACHINES)
+            elapsed = (time.perf_counter() - start) / args.repeat
+            print(f"{name:>24} {func.__name__:>16}: {elapsed * 1000:8.2f} ms")
+            results.append(result)
+        pd.testing.assert_frame_equal(results[0], results[1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Compares accumulating monthly worksheets with repeated pd.concat against
+materialize_worksheet's single concat.
+
+    python -m benchmarks.bench_merge_workbooks
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import pandas as pd
+
+from benchmarks.synthetic import make_monthly_frames
+from src.data_functions import materialize_worksheet
+
+
+def accumulate_with_repeated_concat(frames):
+    # the merge_workbooks loop before worksheets were materialized once
+    df = frames[0]
+    for frame in frames[1:]:
+        df = pd.concat([df, frame])
+    return df
+
+
+def measure(func, frames):
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = func(frames)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return df, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=int, default=6)
+    parser.add_argument("--rows", type=int, default=3000, help="rows per month")
+    args = parser.parse_args()
+
+    frames = make_monthly_frames(args.years, args.rows)
+    print(f"{len(frames)} monthly frames, {args.rows} rows each")
+    results = {}
+    for name, func in [
+        ("repeated concat", accumulate_with_repeated_concat),
+        ("single concat", materialize_worksheet),
+    ]:
+        df, elapsed, peak = measure(func, frames)
+        results[name] = df
+        print(f"{name:>16}: {elapsed * 1000:8.1f} ms, peak {peak / 2**20:7.1f} MiB")
+    # materialize_worksheet stores some columns as categories, compare values
+    single = results["single concat"]
+    categories = single.select_dtypes("category").columns
+    single = single.astype({col: object for col in categories})
+    pd.testing.assert_frame_equal(results["repeated concat"], single, check_dtype=False)
+
+
+if __name__ == "__main__":
+    main()
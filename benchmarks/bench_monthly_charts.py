@@ -0,0 +1,119 @@
+"""Compares the nested get_group loops the chart functions used against their
+single groupby versions.
+
+    python -m benchmarks.bench_monthly_charts --years 6 --rows 3000
+"""
+
+import argparse
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import INSTITUTIONS, make_monthly_frames
+from src.data_functions import (
+    calc_corral_monthly_sums,
+    calc_monthly_avgs,
+    calc_node_monthly_sums,
+)
+
+
+def calc_monthly_avgs_by_group(df, institutions):
+    # calc_monthly_avgs before it was a single groupby
+    inst_grps = df.groupby(["Institution"])
+    df_with_avgs = {"Institution": [], "Date": [], "Resource": [], "Count": []}
+    for inst in institutions:
+        try:
+            monthly_avg = inst_grps.get_group((inst,))["Date"].value_counts().mean()
+            df_with_avgs["Institution"].append(inst)
+            df_with_avgs["Date"].append("AVG")
+            df_with_avgs["Count"].append(round(monthly_avg))
+            df_with_avgs["Resource"].append("ALL")
+            date_grps = inst_grps.get_group((inst,)).groupby(["Date"])
+            for date in date_grps.groups.keys():
+                machine_grps = date_grps.get_group((date,)).groupby(["Resource"])
+                for machine in machine_grps.groups:
+                    current_count = machine_grps.get_group((machine,)).shape[0]
+                    df_with_avgs["Institution"].append(inst)
+                    df_with_avgs["Resource"].append(machine)
+                    df_with_avgs["Count"].append(round(current_count))
+                    df_with_avgs["Date"].append(date)
+        except KeyError:
+            continue
+    df_with_avgs = pd.DataFrame(df_with_avgs)
+    df_with_avgs.sort_values(["Date", "Institution"], inplace=True)
+    return df_with_avgs
+
+
+def calc_corral_monthly_sums_by_group(df, institutions):
+    # calc_corral_monthly_sums before it was a single groupby
+    inst_grps = df.groupby(["Institution"])
+    dict_with_avgs = {"Institution": [], "Date": [], "Storage Granted (TB)": []}
+    for inst in institutions:
+        try:
+            date_grps = inst_grps.get_group((inst,)).groupby(["Date"])
+            for date in date_grps.groups.keys():
+                monthly_sum = date_grps.get_group((date,))["Storage Granted (TB)"].sum()
+                dict_with_avgs["Institution"].append(inst)
+                dict_with_avgs["Storage Granted (TB)"].append(round(monthly_sum))
+                dict_with_avgs["Date"].append(date)
+        except KeyError:
+            continue
+    df_with_avgs = pd.DataFrame(dict_with_avgs)
+    df_with_avgs.sort_values(["Date", "Institution"], inplace=True)
+    return df_with_avgs
+
+
+def calc_node_monthly_sums_by_group(df, institutions):
+    # calc_node_monthly_sums before it was a single groupby
+    inst_grps = df.groupby(["Institution"])
+    dict_with_avgs = {"Institution": [], "Resource": [], "Date": [], "SU's Charged": []}
+    for inst in institutions:
+        try:
+            date_grps = inst_grps.get_group((inst,)).groupby(["Date"])
+            for date in date_grps.groups.keys():
+                machine_grps = date_grps.get_group((date,)).groupby(["Resource"])
+                for machine in machine_grps.groups:
+                    monthly_sum = machine_grps.get_group((machine,))[
+                        "SU's Charged"
+                    ].sum()
+                    dict_with_avgs["Institution"].append(inst)
+                    dict_with_avgs["Resource"].append(machine)
+                    dict_with_avgs["SU's Charged"].append(round(monthly_sum))
+                    dict_with_avgs["Date"].append(date)
+        except KeyError:
+            continue
+    df_with_avgs = pd.DataFrame(dict_with_avgs)
+    df_with_avgs.sort_values(["Date", "Institution"], inplace=True)
+    return df_with_avgs
+
+
+FUNCTIONS = [
+    (calc_monthly_avgs_by_group, calc_monthly_avgs),
+    (calc_corral_monthly_sums_by_group, calc_corral_monthly_sums),
+    (calc_node_monthly_sums_by_group, calc_node_monthly_sums),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=int, default=6)
+    parser.add_argument("--rows", type=int, default=3000)
+    args = parser.parse_args()
+
+    df = pd.concat(make_monthly_frames(args.years, args.rows), ignore_index=True)
+    df["Storage Granted (TB)"] = df["SU's Charged"] / 1000
+    print(f"{len(df)} rows, {df['Date'].nunique()} months")
+    for by_group, func in FUNCTIONS:
+        results = []
+        for name, f in [("by group", by_group), ("groupby", func)]:
+            start = time.perf_counter()
+            results.append(f(df, INSTITUTIONS))
+            print(
+                f"{func.__name__:>24} {name:>8}: "
+                f"{(time.perf_counter() - start) * 1000:8.1f} ms"
+            )
+        pd.testing.assert_frame_equal(results[0], results[1])
+
+
+if __name__ == "__main__":
+    main()
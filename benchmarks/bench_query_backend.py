@@ -0,0 +1,70 @@
+"""Compares the pandas and SQLite query backends on the same filters.
+
+python -m benchmarks.bench_query_backend --years 6 --rows 3000
+"""
+
+import argparse
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import (
+    INSTITUTIONS,
+    MACHINES,
+    get_synthetic_months,
+    make_monthly_frames,
+)
+from src.data_functions import (
+    filter_sorted_df,
+    materialize_worksheet,
+    sort_worksheet,
+)
+from src.sql_backend import SqlBackend
+
+SHEET = "utrc_individual_user_hpc_usage"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=int, default=6)
+    parser.add_argument("--rows", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    df = materialize_worksheet(make_monthly_frames(args.years, args.rows))
+    df, keys = sort_worksheet(df)
+    months = get_synthetic_months(args.years)
+    print(f"{len(df)} rows, {len(months)} months")
+    backend = SqlBackend({SHEET: df}.__getitem__)
+    start = time.perf_counter()
+    backend.filter_df(SHEET, [], [], [])
+    print(f"{'load into SQLite':>24}: {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    selections = [
+        ("1 institution, 1 month", INSTITUTIONS[:1], months[-1:]),
+        ("all, 1 fiscal year", INSTITUTIONS, months[-12:]),
+        ("all, all months", INSTITUTIONS, months),
+    ]
+    for name, institutions, date_range in selections:
+        results = []
+        for backend_name, func in [
+            (
+                "pandas",
+                lambda: filter_sorted_df(df, keys, institutions, date_range, MACHINES),
+            ),
+            (
+                "sqlite",
+                lambda: backend.filter_df(SHEET, institutions, date_range, MACHINES),
+            ),
+        ]:
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                result = func()
+            elapsed = (time.perf_counter() - start) / args.repeat
+            print(f"{name:>24} {backend_name:>6}: {elapsed * 1000:8.2f} ms")
+            results.append(result)
+        pd.testing.assert_frame_equal(results[0], results[1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Compares read_excel engines, with and without read_workbook's column
+projection and declared dtypes, on a synthetic monthly report.
+
+    python -m benchmarks.bench_read_excel
+"""
+
+import argparse
+import importlib.util
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import make_raw_user_sheet
+from src.data_functions import read_workbook
+
+WORKSHEETS = ["utrc_individual_user_hpc_usage", "utrc_active_allocations"]
+
+
+def write_synthetic_report(path, rows):
+    df = make_raw_user_sheet(rows)
+    df["first_name"] = "First"
+    df["last_name"] = "Last"
+    df["email"] = df["login"] + "@example.edu"
+    # columns the dashboard never displays
+    for col in ["department", "phone", "notes"]:
+        df[col] = f"unused {col}"
+    with pd.ExcelWriter(path) as writer:
+        for sheet in WORKSHEETS:
+            df.to_excel(writer, sheet_name=sheet, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000, help="rows per sheet")
+    args = parser.parse_args()
+
+    engines = ["openpyxl"]
+    if importlib.util.find_spec("python_calamine") is not None:
+        engines.append("calamine")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "utrc_report_2023-01-01_to_2023-02-01.xlsx")
+        write_synthetic_report(path, args.rows)
+        print(f"{len(WORKSHEETS)} sheets, {args.rows} rows each")
+        for engine in engines:
+            for name, read in [
+                ("all columns", lambda: pd.read_excel(path, WORKSHEETS, engine=engine)),
+                ("read_workbook", lambda: read_workbook(path, WORKSHEETS, engine)),
+            ]:
+                start = time.perf_counter()
+                read()
+                elapsed = time.perf_counter() - start
+                print(f"{engine:>9} {name:>14}: {elapsed * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
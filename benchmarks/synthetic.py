@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+from src.constants import INSTITUTIONS as INSTITUTION_NAMES
+from src.constants import INSTITUTIONS_MENU, MACHINES_MENU
+
+INSTITUTIONS = INSTITUTIONS_MENU[1:]
+MACHINES = MACHINES_MENU[1:]
+
+
+def get_synthetic_months(years, first_year=2019):
+    """Returns "yy-mm" dates for consecutive fiscal years, starting in September."""
+    months = []
+    for year in range(first_year, first_year + years):
+        months.extend(f"{year % 100:02d}-{m:02d}" for m in range(9, 13))
+        months.extend(f"{(year + 1) % 100:02d}-{m:02d}" for m in range(1, 9))
+    return months
+
+
+def make_user_sheet(date, rows, seed=0):
+    """Returns a cleaned utrc_individual_user_hpc_usage frame for one month."""
+    rng = np.random.default_rng(seed)
+    logins = [f"user{i}" for i in rng.permutation(rows * 2)[:rows]]
+    return pd.DataFrame(
+        {
+            "Institution": rng.choice(INSTITUTIONS, rows),
+            "Last Name": [f"Last{i}" for i in range(rows)],
+            "First Name": [f"First{i}" for i in range(rows)],
+            "Email": [f"{login}@example.edu" for login in logins],
+            "Login": logins,
+            "Resource": rng.choice(MACHINES, rows),
+            "SU's Charged": rng.gamma(2.0, 500.0, rows).round(2),
+            "Job Count": rng.integers(1, 500, rows),
+            "Date": date,
+        }
+    )
+
+
+def make_monthly_frames(years, rows):
+    return [
+        make_user_sheet(date, rows, seed=i)
+        for i, date in enumerate(get_synthetic_months(years))
+    ]
+
+
+def make_raw_user_sheet(rows, misspellings=5, seed=0):
+    """Returns an uncleaned user worksheet as read from a report, including a
+    few institution spellings that are not in INSTITUTIONS."""
+    rng = np.random.default_rng(seed)
+    names = list(INSTITUTION_NAMES)
+    names += [f"{name}." for name in names[:misspellings]]
+    return pd.DataFrame(
+        {
+            "root_institution_name": rng.choice(names, rows),
+            "login": [f"user{i}" for i in range(rows)],
+            "resource_name": rng.choice(MACHINES, rows),
+            "sus_charged": rng.gamma(2.0, 500.0, rows).round(2),
+        }
+    )
@@ -1,4 +1,12 @@
 settings = {
     "LOGGING_LEVEL": "logging.INFO",
     "DEBUG_MODE": None,  # True or None
+    "DATASET_CACHE_DIR": "cache/dataset",  # parsed reports are cached here between restarts
+    "INGEST_WORKERS": None,  # processes used to parse reports, None for one per CPU
+    "EXCEL_ENGINE": None,  # pandas read_excel engine, None to pick the fastest installed
+    "RELOAD_INTERVAL": 60,  # seconds between checks for new reports, None to disable
+    "QUERY_BACKEND": "pandas",  # "pandas", or "sqlite" to filter worksheet rows with an in-memory SQLite database; totals and charts always use the metric tensors
+    "QUERY_CACHE_MB": 64,  # memory each worker may use for cached query results, None to disable
+    "SHARED_CACHE_PATH": None,  # SQLite file the workers share query results through, e.g. "/dev/shm/utrc-query-cache.sqlite", None to disable
+    "SHARED_CACHE_MB": 48,  # size limit of the shared cache, keep it under the size of /dev/shm
 }
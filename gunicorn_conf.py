@@ -1,3 +1,6 @@
+import gc
+import multiprocessing
+
 worker_tmp_dir = "/dev/shm"
 workers = 4
 threads = 4
@@ -6,3 +9,40 @@ log_file = "gunicorn_logs"
 host = "0.0.0.0"
 port = "8050"
 loglevel = "info"
+# Load the app, and with it the dataset, once in the master before forking, so
+# the workers share its memory pages instead of each building their own copy
+preload_app = True
+
+
+def when_ready(server):
+    # Keep the garbage collector in the workers from writing to the preloaded
+    # objects, which would copy their pages into every worker
+    gc.freeze()
+
+    # One process parses new reports into the dataset artifact. It is spawned
+    # rather than forked, so it shares nothing with the master.
+    from config import settings
+
+    if settings["RELOAD_INTERVAL"]:
+        from src.ingest import watch_reports
+
+        server.ingester = multiprocessing.get_context("spawn").Process(
+            target=watch_reports,
+            args=(settings["RELOAD_INTERVAL"],),
+            name="report-ingest",
+        )
+        server.ingester.start()
+
+
+def on_exit(server):
+    ingester = getattr(server, "ingester", None)
+    if ingester is not None:
+        ingester.terminate()
+        ingester.join()
+
+
+def post_fork(server, worker):
+    # Each worker reopens the dataset once the ingester has rebuilt it
+    from src.data_store import STORE
+
+    STORE.start_watcher(ingest=False)
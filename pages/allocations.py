@@ -1,27 +1,31 @@
 import logging
 import dash
-from dash import Input, Output, State, ctx, dcc, html
+from dash import Input, Output, State, ctx, dcc, html, no_update
 from flask_login import current_user
 
 from config import settings
 from src.data_functions import (
-    calc_monthly_avgs,
     create_fy_options,
-    get_allocation_totals,
     get_date_list,
-    select_df,
+)
+from src.data_store import STORE
+from src.metric_cube import (
+    calc_cube_monthly_avgs,
+    get_summary_totals,
 )
 from src.ui_functions import (
+    get_shown_filters,
+    get_table_page,
     make_bar_graph,
     make_data_table,
     make_df_download_button,
     make_filters,
+    make_shown_filters,
     make_summary_panel,
+    selects_all,
     table_logged_out,
 )
 
-from pages.users import DATAFRAMES
-
 LOGGING_LEVEL = settings["LOGGING_LEVEL"]
 logging.basicConfig(level=LOGGING_LEVEL)
 
@@ -31,12 +35,6 @@ app = dash.get_app()
 FY_OPTIONS = create_fy_options()
 logging.debug(f"FY Options: {FY_OPTIONS}")
 
-ALLOC_DATAFRAMES = {
-    "utrc_active_allocations": DATAFRAMES["utrc_active_allocations"],
-    "utrc_current_allocations": DATAFRAMES["utrc_current_allocations"],
-    "utrc_new_allocation_requests": DATAFRAMES["utrc_new_allocation_requests"],
-}
-
 dd_options = [
     {"label": "Active Allocations", "value": "utrc_active_allocations"},
     {"label": "Current Allocations", "value": "utrc_current_allocations"},
@@ -44,22 +42,24 @@ dd_options = [
 ]
 
 
-layout = html.Div(
-    [
-        html.H1("Allocations", className="page-title"),
-        make_filters("Allocations:", dd_options, "utrc_active_allocations"),
-        # TOTALS
-        make_summary_panel(
-            ["Average Total Allocations", "Average Active", "Average Idle"],
-            ["total_allocations", "active_allocations", "idle_allocations"],
-        ),
-        # END TOTALS
-        html.Div(children=[], id="allocations_bargraph", className="my_graphs"),
-        html.Div(children=[], id="allocations_table", className="my_tables"),
-        html.Hr(),
-        dcc.Location(id="url"),
-    ],
-)
+def layout(**kwargs):
+    return html.Div(
+        [
+            html.H1("Allocations", className="page-title"),
+            make_filters("Allocations:", dd_options, "utrc_active_allocations"),
+            # TOTALS
+            make_summary_panel(
+                ["Average Total Allocations", "Average Active", "Average Idle"],
+                ["total_allocations", "active_allocations", "idle_allocations"],
+            ),
+            # END TOTALS
+            html.Div(children=[], id="allocations_bargraph", className="my_graphs"),
+            html.Div(children=[], id="allocations_table", className="my_tables"),
+            dcc.Store(id="allocations_shown"),
+            html.Hr(),
+            dcc.Location(id="url"),
+        ],
+    )
 
 
 @app.callback(
@@ -85,8 +85,7 @@ def deliver_download(
     else:
         # prepare df
         dates = get_date_list(start_date, end_date)
-        df = select_df(
-            ALLOC_DATAFRAMES,
+        df = STORE.query(
             dropdown,
             checklist,
             dates,
@@ -95,6 +94,38 @@ def deliver_download(
         return dcc.send_data_frame(df.to_csv, "utrc_data.csv")
 
 
+@app.callback(
+    Output("allocations-datatable", "data"),
+    Output("allocations-datatable", "page_count"),
+    Input("allocations-datatable", "page_current"),
+    Input("allocations-datatable", "sort_by"),
+    Input("allocations-datatable", "filter_query"),
+    State("dropdown", "value"),
+    State("select_institutions_dd", "value"),
+    State("select_machine_dd", "value"),
+    State("start_date_dd", "value"),
+    State("end_date_dd", "value"),
+    prevent_initial_call=True,
+)
+def update_table(
+    page_current,
+    sort_by,
+    filter_query,
+    dropdown,
+    institutions,
+    machines,
+    start_date,
+    end_date,
+):
+    if not current_user.is_authenticated:
+        return no_update, no_update
+    dates = get_date_list(start_date, end_date)
+    df = STORE.snapshot().table_view(
+        dropdown, institutions, dates, machines, sort_by, filter_query
+    )
+    return get_table_page(df, page_current)
+
+
 # ADD INTERACTIVITY THROUGH CALLBACKS
 @app.callback(
     Output("allocations_table", "children"),
@@ -102,11 +133,13 @@ def deliver_download(
     Output("total_allocations", "children"),
     Output("active_allocations", "children"),
     Output("idle_allocations", "children"),
+    Output("allocations_shown", "data"),
     Input("dropdown", "value"),
     Input("select_institutions_dd", "value"),
     Input("select_machine_dd", "value"),
     Input("start_date_dd", "value"),
     Input("end_date_dd", "value"),
+    State("allocations_shown", "data"),
 )
 def update_figs(
     dropdown,
@@ -114,19 +147,43 @@ def update_figs(
     machines,
     start_date,
     end_date,
+    shown,
 ):
     logging.debug(f"Callback trigger id: {ctx.triggered_id}")
+    if selects_all(institutions, machines):
+        return (no_update,) * 6
+    dataset = STORE.snapshot()
     dates = get_date_list(start_date, end_date)
-    df = select_df(ALLOC_DATAFRAMES, dropdown, institutions, dates, machines)
+    shown = get_shown_filters(shown, dataset.fingerprint, dropdown)
     if not current_user.is_authenticated:
-        table = table_logged_out
+        # the notice is already on the page once the graphs are
+        table = table_logged_out if shown is None else no_update
     else:
+        df = dataset.query(dropdown, institutions, dates, machines)
         table = [
-            make_data_table(df, [{"column_id": "SU's Charged", "direction": "desc"}]),
+            make_data_table(
+                df,
+                [{"column_id": "SU's Charged", "direction": "desc"}],
+                "allocations-datatable",
+            ),
             make_df_download_button("allocations"),
         ]
 
-    df_with_avgs = calc_monthly_avgs(df, institutions)
+    df_with_avgs = dataset.aggregate(
+        calc_cube_monthly_avgs, dropdown, institutions, dates, machines
+    )
+    previous = None
+    if shown is not None:
+        previous = (
+            dataset.aggregate(
+                calc_cube_monthly_avgs,
+                dropdown,
+                shown["institutions"],
+                shown["dates"],
+                shown["machines"],
+            ),
+            shown["dates"],
+        )
 
     bargraph = make_bar_graph(
         df_with_avgs,
@@ -135,13 +192,14 @@ def update_figs(
         "Count",
         "Number of Allocations",
         "Resource",
+        previous,
     )
 
-    totals = get_allocation_totals(
-        ALLOC_DATAFRAMES,
+    totals = get_summary_totals(
+        dataset,
+        ["active_allocations", "idle_allocations"],
         institutions,
         dates,
-        ["utrc_active_allocations", "utrc_current_allocations"],
         machines,
     )
 
@@ -155,4 +213,7 @@ def update_figs(
         totals["total_allocations"],
         totals["active_allocations"],
         totals["idle_allocations"],
+        make_shown_filters(
+            dataset.fingerprint, dropdown, institutions, dates, machines
+        ),
     )
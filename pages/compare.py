@@ -21,18 +21,22 @@ from src.ui_functions import (
     table_logged_out,
     make_data_table,
     make_df_download_button,
+    get_table_page,
+    selects_all,
 )
 from src.data_functions import (
     get_marks,
     get_date_list,
-    select_df,
     split_month,
     check_date_order,
-    calc_node_monthly_sums_no_machine,
-    calc_corral_monthly_sums,
 )
 from src.constants import MONTH_NAMES, DD_OPTIONS, REPORT_INFO
-from pages.users import DATAFRAMES
+from src.data_store import STORE
+from src.query_cache import normalize_filters
+from src.metric_cube import (
+    calc_cube_corral_monthly_sums,
+    calc_cube_node_monthly_sums_no_machine,
+)
 
 
 register_page(__name__)
@@ -92,17 +96,18 @@ def check_valid_date_ranges(start, end):
     return ""
 
 
-layout = html.Div(
-    [
-        html.H1("Compare Date Ranges", className="page-title"),
-        make_other_filters(
-            DD_OPTIONS["Users"], "utrc_individual_user_hpc_usage", "Users"
-        ),
-        make_date_filters(),
-        bg1,
-        html.Div(id="compare-table"),
-    ]
-)
+def layout(**kwargs):
+    return html.Div(
+        [
+            html.H1("Compare Date Ranges", className="page-title"),
+            make_other_filters(
+                DD_OPTIONS["Users"], "utrc_individual_user_hpc_usage", "Users"
+            ),
+            make_date_filters(),
+            bg1,
+            html.Div(id="compare-table"),
+        ]
+    )
 
 
 # Callbacks
@@ -169,6 +174,58 @@ def add_date_range(n_clicks, start, end):
         return patched_range_list
 
 
+def get_compare_frames(
+    dataset, report_dd, institution, machines, start_dates, end_dates
+):
+    """Returns the institution's rows or monthly sums for each date range, and
+    the names of the ranges."""
+    dfs = []
+    names = []
+
+    # zip through the start/end date pairs and use get_date_list to get the dates in each range
+    for idx, (start, end) in enumerate(zip(start_dates, end_dates)):
+        date_range = get_date_list(start, end)
+        name = f"{date_range[0]} to {date_range[-1]}"
+        names.append(name)
+
+        sheet = REPORT_INFO[report_dd][2]
+
+        # usage charts are aggregated from the metric tensor
+        if report_dd == "utrc_sus_charged":
+            df = calc_cube_node_monthly_sums_no_machine(
+                dataset.get_tensor(sheet), institution, date_range, machines
+            )
+        elif report_dd == "utrc_corral_usage":
+            df = dataset.aggregate(
+                calc_cube_corral_monthly_sums,
+                sheet,
+                [institution],
+                date_range,
+                machines,
+            )
+        else:
+            df = dataset.query(sheet, [institution], date_range, machines)
+
+        # assign each unique date a bin number, when a month appears again in a
+        # date range > 1 year, append a space to its name so it is a new bin
+        dates = df["Date"].astype(str)
+        bins = {date: i for i, date in enumerate(dates.unique())}
+        month_names = {
+            date: MONTH_NAMES[split_month(date)] + (i // 12) * " "
+            for date, i in bins.items()
+        }
+        # query results are shared through the cache, so add columns to a copy
+        df = df.assign(Bin=dates.map(bins), **{"Month Name": dates.map(month_names)})
+        dfs.append(df)
+    return dfs, names
+
+
+def get_compare_key(report_dd, institution, machines, start_dates, end_dates):
+    """Returns the query cache key of the rows of all date ranges together."""
+    _, _, machines = normalize_filters([], [], machines)
+    return ("compare", report_dd, institution, machines, *zip(start_dates, end_dates))
+
+
 @callback(
     Output("bar-graph-comparison", "figure"),
     Output("comparison-title", "children"),
@@ -188,52 +245,16 @@ def update_figs(
     start_dates,
     end_dates,
 ):
+    if selects_all(machines):
+        return no_update, no_update, no_update, no_update
     err = check_valid_date_ranges(start_dates, end_dates)
     if err:
         return no_update, no_update, no_update, err
 
-    dfs = []
-    names = []
-
-    # zip through the start/end date pairs and use get_date_list to get the dates in each range
-    for idx, (start, end) in enumerate(zip(start_dates, end_dates)):
-        date_range = get_date_list(start, end)
-        name = f"{date_range[0]} to {date_range[-1]}"
-        names.append(name)
-
-        df = select_df(
-            DATAFRAMES,
-            REPORT_INFO[report_dd][2],
-            [institution],
-            date_range,
-            machines,
-        )
-
-        # do additional aggregation for usage charts
-        if report_dd == "utrc_sus_charged":
-            df = calc_node_monthly_sums_no_machine(df, institution)
-        elif report_dd == "utrc_corral_usage":
-            df = calc_corral_monthly_sums(df, [institution])
-
-        # assign each unique date a bin number
-        unique_bins = df["Date"].unique()
-        num_bins = unique_bins.size
-        bins_list = unique_bins.tolist()
-
-        map_df = pd.DataFrame(
-            {"dates": bins_list, "bins": [x for x in range(num_bins)]}
-        )
-        df["Bin"] = df["Date"].map(map_df.set_index("dates").squeeze())
-
-        def get_month_name(date, bin):
-            month_num = split_month(date)
-            which_year = bin // 12
-            # when a month appears again in a date range > 1 year, append a space to the end so that it will be a new bin
-            month_name = MONTH_NAMES[month_num] + (which_year * " ")
-            return month_name
-
-        df["Month Name"] = df.apply(lambda x: get_month_name(x.Date, x.Bin), axis=1)
-        dfs.append(df)
+    dataset = STORE.snapshot()
+    dfs, names = get_compare_frames(
+        dataset, report_dd, institution, machines, start_dates, end_dates
+    )
 
     if report_dd == "utrc_sus_charged" or report_dd == "utrc_corral_usage":
         fig = make_bar_graph_comparison(
@@ -253,13 +274,61 @@ def update_figs(
     if not current_user.is_authenticated:
         table = table_logged_out
     else:
-        all_dfs = pd.concat(dfs)
+        all_dfs = dataset.cached(
+            get_compare_key(report_dd, institution, machines, start_dates, end_dates),
+            lambda: pd.concat(dfs),
+        )
         table = [
             make_data_table(
                 all_dfs,
                 [{"column_id": "Date", "direction": "asc"}],
+                "compare-datatable",
             ),
             make_df_download_button("compare"),
         ]
 
     return fig, title, table, err
+
+
+@callback(
+    Output("compare-datatable", "data"),
+    Output("compare-datatable", "page_count"),
+    Input("compare-datatable", "page_current"),
+    Input("compare-datatable", "sort_by"),
+    Input("compare-datatable", "filter_query"),
+    State("report-specific-dd", "value"),
+    State("select-institution-dd", "value"),
+    State("select-machine-dd", "value"),
+    State({"type": "start-date-dd", "index": ALL}, "value"),
+    State({"type": "end-date-dd", "index": ALL}, "value"),
+    prevent_initial_call=True,
+)
+def update_table(
+    page_current,
+    sort_by,
+    filter_query,
+    report_dd,
+    institution,
+    machines,
+    start_dates,
+    end_dates,
+):
+    if not current_user.is_authenticated or check_valid_date_ranges(
+        start_dates, end_dates
+    ):
+        return no_update, no_update
+    dataset = STORE.snapshot()
+
+    def get_rows():
+        dfs, _ = get_compare_frames(
+            dataset, report_dd, institution, machines, start_dates, end_dates
+        )
+        return pd.concat(dfs)
+
+    df = dataset.rows_view(
+        get_compare_key(report_dd, institution, machines, start_dates, end_dates),
+        get_rows,
+        sort_by,
+        filter_query,
+    )
+    return get_table_page(df, page_current)
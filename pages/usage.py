@@ -1,60 +1,63 @@
 import logging
 import dash
-from dash import Input, Output, State, ctx, dcc, html
+from dash import Input, Output, State, ctx, dcc, html, no_update
 from flask_login import current_user
 
 from config import settings
 from src.data_functions import (
-    calc_corral_monthly_sums_with_peaks,
     calc_corral_total,
-    calc_node_monthly_sums,
     get_date_list,
-    select_df,
+)
+from src.data_store import STORE
+from src.metric_cube import (
+    calc_cube_corral_monthly_sums_with_peaks,
+    calc_cube_node_monthly_sums,
+    calc_range_total,
 )
 from src.ui_functions import (
+    get_shown_filters,
+    get_table_page,
     make_bar_graph,
     make_data_table,
     make_df_download_button,
     make_filters,
+    make_shown_filters,
     make_summary_panel,
+    selects_all,
     table_logged_out,
 )
 
-from pages.users import DATAFRAMES
-
 LOGGING_LEVEL = settings["LOGGING_LEVEL"]
 logging.basicConfig(level=LOGGING_LEVEL)
 
 dash.register_page(__name__)
 app = dash.get_app()
 
-USAGE_DATAFRAMES = {
-    "utrc_active_allocations": DATAFRAMES["utrc_active_allocations"],
-    "utrc_corral_usage": DATAFRAMES["utrc_corral_usage"],
-}
-
 dd_options = [
     {"label": "Active Allocations", "value": "utrc_active_allocations"},
     {"label": "Corral Usage", "value": "utrc_corral_usage"},
 ]
 
-layout = html.Div(
-    [
-        html.H1("Usage", className="page-title"),
-        make_filters("Usage:", dd_options, "utrc_active_allocations"),
-        # TOTALS
-        make_summary_panel(
-            ["Sum SUs Used", "Peak Storage Allocated (TB)"],
-            ["total_sus", "total_storage"],
-        ),
-        # END TOTALS
-        html.Div(children=[], id="node_graph"),
-        html.Div(children=[], id="corral_graph"),
-        html.Div(children=[], id="usage_table", className="my_tables"),
-        html.Hr(),
-        dcc.Location(id="url"),
-    ],
-)
+
+def layout(**kwargs):
+    return html.Div(
+        [
+            html.H1("Usage", className="page-title"),
+            make_filters("Usage:", dd_options, "utrc_active_allocations"),
+            # TOTALS
+            make_summary_panel(
+                ["Sum SUs Used", "Peak Storage Allocated (TB)"],
+                ["total_sus", "total_storage"],
+            ),
+            # END TOTALS
+            html.Div(children=[], id="node_graph"),
+            html.Div(children=[], id="corral_graph"),
+            html.Div(children=[], id="usage_table", className="my_tables"),
+            dcc.Store(id="usage_shown"),
+            html.Hr(),
+            dcc.Location(id="url"),
+        ],
+    )
 
 
 @app.callback(
@@ -80,8 +83,7 @@ def func(
     else:
         # prepare df
         dates = get_date_list(start_date, end_date)
-        df = select_df(
-            USAGE_DATAFRAMES,
+        df = STORE.query(
             dropdown,
             checklist,
             dates,
@@ -90,6 +92,38 @@ def func(
         return dcc.send_data_frame(df.to_csv, "utrc_data.csv")
 
 
+@app.callback(
+    Output("usage-datatable", "data"),
+    Output("usage-datatable", "page_count"),
+    Input("usage-datatable", "page_current"),
+    Input("usage-datatable", "sort_by"),
+    Input("usage-datatable", "filter_query"),
+    State("dropdown", "value"),
+    State("select_institutions_dd", "value"),
+    State("select_machine_dd", "value"),
+    State("start_date_dd", "value"),
+    State("end_date_dd", "value"),
+    prevent_initial_call=True,
+)
+def update_table(
+    page_current,
+    sort_by,
+    filter_query,
+    dropdown,
+    institutions,
+    machines,
+    start_date,
+    end_date,
+):
+    if not current_user.is_authenticated:
+        return no_update, no_update
+    dates = get_date_list(start_date, end_date)
+    df = STORE.snapshot().table_view(
+        dropdown, institutions, dates, machines, sort_by, filter_query
+    )
+    return get_table_page(df, page_current)
+
+
 # ADD INTERACTIVITY THROUGH CALLBACKS
 @app.callback(
     Output("usage_table", "children"),
@@ -97,11 +131,13 @@ def func(
     Output("corral_graph", "children"),
     Output("total_sus", "children"),
     Output("total_storage", "children"),
+    Output("usage_shown", "data"),
     Input("dropdown", "value"),
     Input("select_institutions_dd", "value"),
     Input("select_machine_dd", "value"),
     Input("start_date_dd", "value"),
     Input("end_date_dd", "value"),
+    State("usage_shown", "data"),
 )
 def update_figs(
     dropdown,
@@ -109,15 +145,25 @@ def update_figs(
     machines,
     start_date,
     end_date,
+    shown,
 ):
     logging.debug(f"Callback trigger id: {ctx.triggered_id}")
+    if selects_all(institutions, machines):
+        return (no_update,) * 6
 
+    dataset = STORE.snapshot()
     dates = get_date_list(start_date, end_date)
-    df = select_df(USAGE_DATAFRAMES, dropdown, institutions, dates, machines)
+    # the graphs read fixed worksheets, only the table follows the dropdown
+    shown = get_shown_filters(shown, dataset.fingerprint, None)
+    graphs_shown = shown is not None and ctx.triggered_id == "dropdown"
 
     if not current_user.is_authenticated:
-        table = table_logged_out
+        if graphs_shown:
+            return (no_update,) * 6
+        # the notice is already on the page once the graphs are
+        table = table_logged_out if shown is None else no_update
     else:
+        df = dataset.query(dropdown, institutions, dates, machines)
         table = [
             make_data_table(
                 df,
@@ -126,19 +172,49 @@ def update_figs(
                     {"column_id": "Storage Granted (Gb)", "direction": "desc"},
                     {"column_id": "Institution", "direction": "asc"},
                 ],
+                "usage-datatable",
             ),
             make_df_download_button("usage"),
         ]
+    if graphs_shown:
+        return (table, *(no_update,) * 5)
 
-    sus_df = select_df(
-        USAGE_DATAFRAMES,
+    sus_df_calculated = dataset.aggregate(
+        calc_cube_node_monthly_sums,
         "utrc_active_allocations",
         institutions,
         dates,
         machines,
     )
-    sus_df_calculated = calc_node_monthly_sums(sus_df, institutions)
-    total_sus = int(sus_df["SU's Charged"].sum())
+    total_sus = int(
+        calc_range_total(
+            dataset.get_tensor("utrc_active_allocations"),
+            "SU's Charged",
+            institutions,
+            dates,
+            machines,
+        )
+    )
+
+    node_previous = corral_previous = None
+    if shown is not None:
+        shown_filters = (shown["institutions"], shown["dates"], shown["machines"])
+        node_previous = (
+            dataset.aggregate(
+                calc_cube_node_monthly_sums,
+                "utrc_active_allocations",
+                *shown_filters,
+            ),
+            shown["dates"],
+        )
+        corral_previous = (
+            dataset.aggregate(
+                calc_cube_corral_monthly_sums_with_peaks,
+                "utrc_corral_usage",
+                *shown_filters,
+            ),
+            shown["dates"],
+        )
 
     node_graph = make_bar_graph(
         sus_df_calculated,
@@ -146,16 +222,24 @@ def update_figs(
         dates,
         "SU's Charged",
         hover="Resource",
+        previous=node_previous,
     )
 
-    corral_df = select_df(
-        USAGE_DATAFRAMES, "utrc_corral_usage", institutions, dates, machines
+    corral_df_calculated = dataset.aggregate(
+        calc_cube_corral_monthly_sums_with_peaks,
+        "utrc_corral_usage",
+        institutions,
+        dates,
+        machines,
     )
-    corral_df_calculated = calc_corral_monthly_sums_with_peaks(corral_df, institutions)
     total_storage = calc_corral_total(corral_df_calculated)
 
     corral_graph = make_bar_graph(
-        corral_df_calculated, "Corral Usage", dates, "Storage Granted (TB)"
+        corral_df_calculated,
+        "Corral Usage",
+        dates,
+        "Storage Granted (TB)",
+        previous=corral_previous,
     )
 
     return (
@@ -164,4 +248,5 @@ def update_figs(
         corral_graph,
         "{:,}".format(total_sus),
         "{:,}".format(total_storage),
+        make_shown_filters(dataset.fingerprint, None, institutions, dates, machines),
     )
@@ -1,86 +1,42 @@
 import logging
 import dash
-import pandas as pd
-from dash import Input, Output, State, ctx, dcc, html
+from dash import Input, Output, State, ctx, dcc, html, no_update
 from flask_login import current_user
-from src.constants import REPORTS_PATH
 from src.data_functions import (
     create_fy_options,
     get_date_list,
-    get_totals,
-    select_df,
-    get_workbook_paths,
-    initialize_df,
-    update_worksheet_columns
 )
+from src.data_store import STORE
+from src.metric_cube import calc_cube_monthly_counts, get_summary_totals
 from src.ui_functions import (
+    get_shown_filters,
+    get_table_page,
     make_bar_graph,
     make_data_table,
     make_df_download_button,
     make_filters,
+    make_shown_filters,
     make_summary_panel,
+    selects_all,
     table_logged_out,
 )
 from config import settings
 
-if settings["DEBUG_MODE"]:
-    from flask_caching import Cache
-
 logging.basicConfig(level=settings["LOGGING_LEVEL"])
 
 dash.register_page(__name__, path="/")
 app = dash.get_app()
 
-
-def merge_workbooks(WORKSHEETS):
-    logging.info(f"Processing workbooks for {', '.join(WORKSHEETS)}")
-    workbook_paths = get_workbook_paths(REPORTS_PATH)
-    for index, path in enumerate(workbook_paths):
-        workbook = initialize_df(path, WORKSHEETS)
-        filename = path.split("/")[-1]
-        logging.info(f"Processing {filename}")
-        workbook = update_worksheet_columns(workbook, filename)
-
-        if index == 0:
-            dict_of_dfs = workbook
-        else:
-            for sheet in WORKSHEETS:
-                dict_of_dfs[sheet] = pd.concat([dict_of_dfs[sheet], workbook[sheet]])
-    logging.info(f"Done processing workbooks for {', '.join(WORKSHEETS)}")
-    return dict_of_dfs
-
-
-WORKSHEETS = [
-    "utrc_individual_user_hpc_usage",
-    "utrc_new_users",
-    "utrc_idle_users",
-    "utrc_suspended_users",
-    "utrc_active_allocations",
-    "utrc_current_allocations",
-    "utrc_new_allocation_requests",
-    "utrc_corral_usage",
-]
-
-# only use caching in debug mode, since caching only helps on startup and production is only restarted when there is new data
-if settings["DEBUG_MODE"]:
-    # set up cache
-    cache = Cache(app.server)
-    cache.init_app(app.server)
-    merge_workbooks = cache.memoize()(merge_workbooks)
-    DATAFRAMES = merge_workbooks(WORKSHEETS)
-else:
-    DATAFRAMES = merge_workbooks(WORKSHEETS)
+# Read the worksheets the landing page needs before gunicorn forks its workers,
+# the rest are read on first use
+STORE.preload(
+    sheets=["utrc_individual_user_hpc_usage"],
+    tensors=["utrc_individual_user_hpc_usage", "utrc_idle_users"],
+)
 
 
 FY_OPTIONS = create_fy_options()
 
-USER_DATAFRAMES = {
-    "utrc_individual_user_hpc_usage": DATAFRAMES["utrc_individual_user_hpc_usage"],
-    "utrc_new_users": DATAFRAMES["utrc_new_users"],
-    "utrc_idle_users": DATAFRAMES["utrc_idle_users"],
-    "utrc_suspended_users": DATAFRAMES["utrc_suspended_users"],
-}
-
 dd_options = [
     {
         "label": "Active Users",
@@ -94,25 +50,30 @@ dd_options = [
     },
 ]
 
+
 # CUSTOMIZE LAYOUT
-layout = html.Div(
-    [
-        html.Div(
-            [
-                html.H1("Users", className="page-title"),
-                make_filters("Users:", dd_options, "utrc_individual_user_hpc_usage"),
-                make_summary_panel(
-                    ["Average Total Users", "Average Active", "Average Idle"],
-                    ["total_users", "active_users", "idle_users"],
-                ),
-                html.Div(children=[], id="bargraph"),
-                html.Div(children=[], id="table"),
-                html.Hr(),
-            ],
-        ),
-        dcc.Location(id="url"),
-    ]
-)
+def layout(**kwargs):
+    return html.Div(
+        [
+            html.Div(
+                [
+                    html.H1("Users", className="page-title"),
+                    make_filters(
+                        "Users:", dd_options, "utrc_individual_user_hpc_usage"
+                    ),
+                    make_summary_panel(
+                        ["Average Total Users", "Average Active", "Average Idle"],
+                        ["total_users", "active_users", "idle_users"],
+                    ),
+                    html.Div(children=[], id="bargraph"),
+                    html.Div(children=[], id="table"),
+                    dcc.Store(id="users_shown"),
+                    html.Hr(),
+                ],
+            ),
+            dcc.Location(id="url"),
+        ]
+    )
 
 
 # ADD INTERACTIVITY THROUGH CALLBACKS
@@ -139,8 +100,7 @@ def func(
     else:
         # prepare df
         dates = get_date_list(start_date, end_date)
-        df = select_df(
-            USER_DATAFRAMES,
+        df = STORE.query(
             dropdown,
             checklist,
             dates,
@@ -149,17 +109,51 @@ def func(
         return dcc.send_data_frame(df.to_csv, "utrc_data.csv")
 
 
+@app.callback(
+    Output("users-datatable", "data"),
+    Output("users-datatable", "page_count"),
+    Input("users-datatable", "page_current"),
+    Input("users-datatable", "sort_by"),
+    Input("users-datatable", "filter_query"),
+    State("dropdown", "value"),
+    State("select_institutions_dd", "value"),
+    State("select_machine_dd", "value"),
+    State("start_date_dd", "value"),
+    State("end_date_dd", "value"),
+    prevent_initial_call=True,
+)
+def update_table(
+    page_current,
+    sort_by,
+    filter_query,
+    dropdown,
+    institutions,
+    machines,
+    start_date,
+    end_date,
+):
+    if not current_user.is_authenticated:
+        return no_update, no_update
+    dates = get_date_list(start_date, end_date)
+    df = STORE.snapshot().table_view(
+        dropdown, institutions, dates, machines, sort_by, filter_query
+    )
+    return get_table_page(df, page_current)
+
+
 @app.callback(
     Output("table", "children", allow_duplicate=True),
     Output("bargraph", "children", allow_duplicate=True),
     Output("active_users", "children", allow_duplicate=True),
     Output("idle_users", "children", allow_duplicate=True),
     Output("total_users", "children", allow_duplicate=True),
+    Output("users_shown", "data"),
     Input("dropdown", "value"),
     Input("select_institutions_dd", "value"),
     Input("select_machine_dd", "value"),
     Input("start_date_dd", "value"),
     Input("end_date_dd", "value"),
+    State("users_shown", "data"),
 )
 def update_figs(
     dropdown,
@@ -167,46 +161,50 @@ def update_figs(
     machines,
     start_date,
     end_date,
+    shown,
 ):
     logging.debug(f"Callback trigger id: {ctx.triggered_id}")
+    if selects_all(checklist, machines):
+        return (no_update,) * 6
+    dataset = STORE.snapshot()
     dates = get_date_list(start_date, end_date)
-    df = select_df(
-        USER_DATAFRAMES,
-        dropdown,
-        checklist,
-        dates,
-        machines,
-    )
+    shown = get_shown_filters(shown, dataset.fingerprint, dropdown)
 
     if not current_user.is_authenticated:
-        table = table_logged_out
+        # the notice is already on the page once the graphs are
+        table = table_logged_out if shown is None else no_update
     else:
+        df = dataset.query(dropdown, checklist, dates, machines)
         table = [
-            make_data_table(df),
+            make_data_table(df, table_id="users-datatable"),
             make_df_download_button("users"),
         ]
 
-    inst_grps = df.groupby(["Institution"])
-    df_with_avgs = {"Institution": [], "Date": []}
-    for group in checklist:
-        try:
-            monthly_avg = inst_grps.get_group((group,))["Date"].value_counts().mean()
-            for i in range(int(monthly_avg)):
-                df_with_avgs["Institution"].append(group)
-                df_with_avgs["Date"].append("AVG")
-        except KeyError:
-            continue  # For some date ranges, even if an institution is checked, it doesn't appear in the data, throwing an error
-    combined_df = pd.concat([df, pd.DataFrame(df_with_avgs)])
-
-    bargraph = make_bar_graph(
-        combined_df, "Users per Institution", dates, None, "Number of Users"
+    df_with_avgs = dataset.aggregate(
+        calc_cube_monthly_counts, dropdown, checklist, dates, machines
     )
-    totals = get_totals(
-        USER_DATAFRAMES,
-        checklist,
+    previous = None
+    if shown is not None:
+        previous = (
+            dataset.aggregate(
+                calc_cube_monthly_counts,
+                dropdown,
+                shown["institutions"],
+                shown["dates"],
+                shown["machines"],
+            ),
+            shown["dates"],
+        )
+    bargraph = make_bar_graph(
+        df_with_avgs,
+        "Users per Institution",
         dates,
-        ["utrc_individual_user_hpc_usage", "utrc_idle_users"],
-        machines,
+        "Count",
+        "Number of Users",
+        previous=previous,
+    )
+    totals = get_summary_totals(
+        dataset, ["active_users", "idle_users"], checklist, dates, machines
     )
     totals["total_users"] = totals["active_users"] + totals["idle_users"]
 
@@ -216,4 +214,5 @@ def update_figs(
         totals["active_users"],
         totals["idle_users"],
         totals["total_users"],
+        make_shown_filters(dataset.fingerprint, dropdown, checklist, dates, machines),
     )
@@ -1,5 +1,16 @@
 REPORTS_PATH = "assets/data/monthly_reports"
 
+WORKSHEETS = [
+    "utrc_individual_user_hpc_usage",
+    "utrc_new_users",
+    "utrc_idle_users",
+    "utrc_suspended_users",
+    "utrc_active_allocations",
+    "utrc_current_allocations",
+    "utrc_new_allocation_requests",
+    "utrc_corral_usage",
+]
+
 INSTITUTIONS = {
     "The University of Texas": "UTAus",
     "The University of Texas in El Paso": "UTEP",
@@ -167,6 +178,7 @@ COLUMN_ORDER = [
     "End Date",
     "Status",
     "Idle Allocation?",
+    "Unknown Storage Unit?",
     "Primary Field",
     "Secondary Field",
     "Grant Title",
@@ -178,6 +190,29 @@ COLUMN_ORDER = [
     "Date",
 ]
 
+# Columns are read with these dtypes and coerced to them again when worksheets
+# are merged, so a month with a stray string or an empty sheet does not turn
+# them into objects
+COLUMN_DTYPES = {
+    "Institution": "category",
+    "Resource": "category",
+    "Date": "category",
+    "SU's Charged": "float64",
+    "Storage Granted": "float64",
+    "Storage Granted (Gb)": "float64",
+    "Storage Granted (TB)": "float64",
+}
+
+# Categorical columns whose categories are shared by every worksheet
+SHARED_CATEGORY_COLUMNS = ["Institution", "Resource", "Date"]
+
+# Multipliers that convert Corral storage_unit values to TB
+STORAGE_UNITS_IN_TB = {
+    "GB": 1 / 1024.0,
+    "TB": 1.0,
+    "PB": 1024.0,
+}
+
 PROTECTED_COLUMNS = [
     "email",
     "Email",
@@ -1,20 +1,41 @@
+import importlib.util
 import logging
+import multiprocessing
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from os import walk
+from os import cpu_count, walk
+import numpy as np
 import pandas as pd
 from fuzzywuzzy import fuzz
+from config import settings
 from src.constants import FISCAL_YEAR_MONTHS
 
 from .constants import (
+    COLUMN_DTYPES,
     COLUMN_HEADERS,
     COLUMN_ORDER,
     INSTITUTIONS,
+    REPORTS_PATH,
+    SHARED_CATEGORY_COLUMNS,
+    STORAGE_UNITS_IN_TB,
     WORKSHEETS_RM_DUPLICATES,
 )
 
 logging.basicConfig(level=logging.INFO)
 
+# Institution spellings missing from INSTITUTIONS, resolved by fuzzy matching
+INSTITUTION_ALIASES = {}
+
+# Report columns that are read from each workbook, and their declared dtypes
+READ_COLUMNS = set(COLUMN_HEADERS) | set(COLUMN_ORDER)
+READ_DTYPES = {
+    report_col: COLUMN_DTYPES[col]
+    for report_col, col in COLUMN_HEADERS.items()
+    if col in COLUMN_DTYPES
+}
+
 
 def fuzzy_match_institution(institution_input):
     top_score = 0
@@ -31,6 +52,25 @@ def fuzzy_match_institution(institution_input):
     return INSTITUTIONS[top_institution]
 
 
+def lookup_institution(institution_input):
+    try:
+        return INSTITUTIONS[institution_input]
+    except KeyError:
+        pass
+    if institution_input not in INSTITUTION_ALIASES:
+        INSTITUTION_ALIASES[institution_input] = fuzzy_match_institution(
+            institution_input
+        )
+    return INSTITUTION_ALIASES[institution_input]
+
+
+def normalize_institutions(institutions):
+    """Replaces full institution names with abbreviations. Each distinct name
+    is looked up once, no matter how many rows it appears in."""
+    abbreviations = {name: lookup_institution(name) for name in institutions.unique()}
+    return institutions.map(abbreviations)
+
+
 def get_fiscal_year_dates(fiscal_year):
     start = fiscal_year.split("-")[0]
     end = fiscal_year.split("-")[1]
@@ -103,22 +143,30 @@ def update_worksheet_columns(workbook, filename):
 
 
 def normalize_storage_granted(df):
-
-    def update_units(row):
-        if row["Storage Unit"].upper() == "GB":
-            return row["Storage Granted"] / 1024.0
-        elif row["Storage Unit"].upper() == "TB":
-            return row["Storage Granted"]
-
+    """Adds a "Storage Granted (TB)" column. Rows whose storage unit is not in
+    STORAGE_UNITS_IN_TB are marked in the "Unknown Storage Unit?" column."""
     new_df = df.copy()
 
     if "Storage Granted (Gb)" in df.columns:
-        new_df["Storage Granted (TB)"] = new_df["Storage Granted (Gb)"] / 1024.0
+        granted = pd.to_numeric(new_df["Storage Granted (Gb)"], errors="coerce")
+        new_df["Storage Granted (TB)"] = granted / 1024.0
     elif "Storage Granted" in new_df.columns:
-        new_df["Storage Granted (TB)"] = new_df.apply(update_units, axis=1)
+        units = new_df["Storage Unit"].astype(str).str.strip().str.upper()
+        multipliers = units.map(STORAGE_UNITS_IN_TB)
+        granted = pd.to_numeric(new_df["Storage Granted"], errors="coerce")
+        new_df["Storage Granted (TB)"] = granted * multipliers
+
+        unknown = multipliers.isna()
+        new_df["Unknown Storage Unit?"] = unknown.map({True: "X", False: None})
+        if unknown.any():
+            logging.warning(
+                f"{unknown.sum()} Corral rows have unknown storage units: "
+                f"{', '.join(sorted(units[unknown].unique()))}"
+            )
 
     return new_df
 
+
 def get_date_from_filename(filename, prefix="utrc_report"):
     pattern = re.compile("{}_(.*)_to_(.*).xlsx".format(prefix))
     match = pattern.match(filename)
@@ -130,11 +178,43 @@ def get_date_from_filename(filename, prefix="utrc_report"):
     return series_date
 
 
+def get_excel_engine():
+    """Returns the configured read_excel engine, or calamine when it is
+    installed since it parses reports much faster than openpyxl."""
+    if settings.get("EXCEL_ENGINE"):
+        return settings["EXCEL_ENGINE"]
+    if importlib.util.find_spec("python_calamine") is not None:
+        return "calamine"
+    return "openpyxl"
+
+
+def read_workbook(workbook_path, WORKSHEETS, engine=None):
+    """Reads the requested worksheets, parsing only the columns the dashboard
+    uses and applying their declared dtypes."""
+    engine = engine or get_excel_engine()
+    try:
+        return pd.read_excel(
+            workbook_path,
+            WORKSHEETS,
+            engine=engine,
+            usecols=lambda col: col in READ_COLUMNS,
+            dtype=READ_DTYPES,
+        )
+    except ValueError as ex:
+        logging.warning(f"Reading {workbook_path} without declared dtypes: {ex}")
+        return pd.read_excel(
+            workbook_path,
+            WORKSHEETS,
+            engine=engine,
+            usecols=lambda col: col in READ_COLUMNS,
+        )
+
+
 def initialize_df(workbook_path, WORKSHEETS):
     """
     To keep the dashboard running quickly, data should be read in only once.
     """
-    dataframes = pd.read_excel(workbook_path, WORKSHEETS)
+    dataframes = read_workbook(workbook_path, WORKSHEETS)
     for worksheet in dataframes:
         if dataframes[worksheet].empty:
             continue
@@ -145,6 +225,111 @@ def initialize_df(workbook_path, WORKSHEETS):
     return dataframes
 
 
+def parse_workbook(workbook_path, WORKSHEETS):
+    filename = workbook_path.split("/")[-1]
+    start = time.perf_counter()
+    workbook = initialize_df(workbook_path, WORKSHEETS)
+    workbook = update_worksheet_columns(workbook, filename)
+    logging.info(f"Processed {filename} in {time.perf_counter() - start:.2f}s")
+    return workbook
+
+
+def seed_aliases(aliases):
+    # runs in each pool process, whose module state starts out empty
+    INSTITUTION_ALIASES.update(aliases)
+
+
+def parse_workbook_in_pool(workbook_path, WORKSHEETS):
+    # aliases learned in a pool process are sent back to the parent
+    return parse_workbook(workbook_path, WORKSHEETS), INSTITUTION_ALIASES
+
+
+def parse_workbooks(workbook_paths, WORKSHEETS, workers=None):
+    """Yields parsed workbooks in the same order as workbook_paths. When more
+    than one worker is available, workbooks are parsed in a process pool."""
+    if workers is None:
+        workers = cpu_count() or 1
+    workers = min(workers, len(workbook_paths))
+    if workers <= 1:
+        for path in workbook_paths:
+            yield parse_workbook(path, WORKSHEETS)
+        return
+    # spawned rather than forked, as the caller may be a threaded app worker
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=seed_aliases,
+        initargs=(dict(INSTITUTION_ALIASES),),
+    ) as executor:
+        results = executor.map(
+            parse_workbook_in_pool, workbook_paths, [WORKSHEETS] * len(workbook_paths)
+        )
+        for workbook, aliases in results:
+            INSTITUTION_ALIASES.update(aliases)
+            yield workbook
+
+
+def materialize_worksheet(frames):
+    """Concatenates a worksheet's monthly frames in a single pass and applies
+    the declared column dtypes."""
+    non_empty = [df for df in frames if not df.empty]
+    df = pd.concat(non_empty or frames)
+    for col, dtype in COLUMN_DTYPES.items():
+        if col not in df.columns:
+            continue
+        if dtype == "category":
+            df[col] = df[col].astype(dtype)
+        else:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(dtype)
+    return store_text_in_arrow(df)
+
+
+def store_text_in_arrow(df):
+    """Moves text columns into Arrow buffers. Unlike columns of Python
+    strings, reading them never updates reference counts, so workers forked
+    from a preloading gunicorn master keep sharing their memory pages."""
+    for col, dtype in df.dtypes.items():
+        if isinstance(dtype, pd.StringDtype):
+            is_text = dtype.storage != "pyarrow"
+        else:
+            is_text = (
+                pd.api.types.is_object_dtype(dtype)
+                and pd.api.types.infer_dtype(df[col], skipna=True) == "string"
+            )
+        if is_text:
+            df[col] = df[col].astype("string[pyarrow]")
+    return df
+
+
+def share_categories(dataframes):
+    """Recodes the categorical columns of every worksheet against one sorted
+    set of categories, so each code means the same value in every worksheet
+    and each distinct value is stored once."""
+    for col in SHARED_CATEGORY_COLUMNS:
+        values = set()
+        for df in dataframes.values():
+            if col in df.columns:
+                values.update(df[col].dropna().unique())
+        dtype = pd.CategoricalDtype(sorted(values, key=str))
+        for df in dataframes.values():
+            if col in df.columns:
+                df[col] = df[col].astype(dtype)
+    return dataframes
+
+
+def merge_workbooks(WORKSHEETS, reports_path=REPORTS_PATH, workers=None):
+    logging.info(f"Processing workbooks for {', '.join(WORKSHEETS)}")
+    workbook_paths = sorted(get_workbook_paths(reports_path))
+    frames = {sheet: [] for sheet in WORKSHEETS}
+    for workbook in parse_workbooks(workbook_paths, WORKSHEETS, workers):
+        for sheet in WORKSHEETS:
+            frames[sheet].append(workbook[sheet])
+    dict_of_dfs = {sheet: materialize_worksheet(frames[sheet]) for sheet in WORKSHEETS}
+    share_categories(dict_of_dfs)
+    logging.info(f"Done processing workbooks for {', '.join(WORKSHEETS)}")
+    return dict_of_dfs
+
+
 def clean_df(df):
     # Rename worksheet table header
     df.rename(columns=COLUMN_HEADERS, inplace=True)
@@ -157,11 +342,7 @@ def clean_df(df):
     df.set_index(s, inplace=True)
 
     # Replace full institution names with abbreviations
-    for i in range(df.shape[0]):
-        try:
-            df.loc[i, "Institution"] = INSTITUTIONS[df.loc[i, "Institution"]]
-        except KeyError:
-            df.loc[i, "Institution"] = fuzzy_match_institution(df.loc[i, "Institution"])
+    df["Institution"] = normalize_institutions(df["Institution"])
 
 
 def remove_duplicates(df):
@@ -172,15 +353,77 @@ def remove_duplicates(df):
         pass  # Some worksheets do not have a login column
 
 
+def column_isin(column, values):
+    """Returns a boolean array of the rows whose value is in values.
+    Categorical columns are matched on their integer codes."""
+    if not isinstance(column.dtype, pd.CategoricalDtype):
+        return column.isin(values).to_numpy()
+    # the extra slot at the end is looked up by the -1 code of missing values
+    wanted = np.zeros(len(column.cat.categories) + 1, dtype=bool)
+    indexer = column.cat.categories.get_indexer(pd.Index(values).unique())
+    wanted[indexer[indexer >= 0]] = True
+    return wanted[column.cat.codes.to_numpy()]
+
+
+def filter_mask(df, institutions, date_range, machines):
+    mask = column_isin(df["Institution"], institutions)
+    mask &= column_isin(df["Date"], date_range)
+    mask &= machine_mask(df, machines)
+    return mask
+
+
 def filter_df(df, institutions, date_range, machines):
-    filtered_df = df[df["Institution"].isin(institutions)]
-    filtered_df = filter_by_machine(filtered_df, machines)
-    filtered_df = filtered_df[filtered_df["Date"].isin(date_range)]
+    filtered_df = df[filter_mask(df, institutions, date_range, machines)]
+    filtered_df = filtered_df.sort_values(["Date", "Institution"])
+    filtered_df = sort_columns(filtered_df)
 
-    filtered_df.sort_values(["Date", "Institution"], inplace=True)
+    return decode_columns(filtered_df)
+
+
+def get_sort_keys(df):
+    """Returns one integer per row that orders a worksheet by month and then
+    institution, as filter_df sorts them, with missing values last. Both
+    columns must be categorical."""
+    dates = df["Date"].cat
+    institutions = df["Institution"].cat
+    date_codes = dates.codes.to_numpy().astype("int64")
+    date_codes[date_codes < 0] = len(dates.categories)
+    inst_codes = institutions.codes.to_numpy().astype("int64")
+    inst_codes[inst_codes < 0] = len(institutions.categories)
+    return date_codes * (len(institutions.categories) + 1) + inst_codes
+
+
+def sort_worksheet(df):
+    """Returns the worksheet in the order filter_df returns rows in, keeping
+    the row labels, along with its sort keys."""
+    keys = get_sort_keys(df)
+    if (np.diff(keys) < 0).any():
+        order = np.argsort(keys, kind="stable")
+        df, keys = df.iloc[order], keys[order]
+    return df, keys
+
+
+def filter_sorted_df(df, keys, institutions, date_range, machines):
+    """Same result as filter_df for a worksheet returned by sort_worksheet.
+    Each selected month and institution is a run of rows found by binary
+    search, so the cost grows with the rows returned rather than with the
+    worksheet."""
+    stride = len(df["Institution"].cat.categories) + 1
+    dates = df["Date"].cat.categories.get_indexer(pd.Index(date_range).unique())
+    insts = df["Institution"].cat.categories.get_indexer(
+        pd.Index(institutions).unique()
+    )
+    wanted = dates[dates >= 0, None] * stride + insts[None, insts >= 0]
+    wanted = np.unique(wanted)
+    starts = np.searchsorted(keys, wanted, side="left")
+    lengths = np.searchsorted(keys, wanted, side="right") - starts
+    # positions of every row in the runs, in order
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    filtered_df = df.take(offsets + np.arange(lengths.sum()))
+    filtered_df = filtered_df[machine_mask(filtered_df, machines)]
     filtered_df = sort_columns(filtered_df)
 
-    return filtered_df
+    return decode_columns(filtered_df)
 
 
 def select_df(DATAFRAMES, dropdown_selection, institutions, date_range, machines):
@@ -190,34 +433,158 @@ def select_df(DATAFRAMES, dropdown_selection, institutions, date_range, machines
     return df
 
 
-def filter_by_machine(df, machines):
+FILTER_CLAUSE = re.compile(
+    r"^\{(?P<column>[^}]+)\}\s+(?P<operator>is blank|is not blank|"
+    r"[is]?(?:contains|datestartswith|eq|ne|lt|le|gt|ge|=|!=|<=|<|>=|>))"
+    r"(?:\s+(?P<value>.*))?$"
+)
+FILTER_SYMBOLS = {"=": "eq", "!=": "ne", "<": "lt", "<=": "le", ">": "gt", ">=": "ge"}
+FILTER_OPERATORS = ["contains", "datestartswith", *FILTER_SYMBOLS.values()]
+
+
+def parse_filter_value(value):
+    """Returns a filter value without its quotes."""
+    value = value.strip()
+    if len(value) > 1 and value[0] == value[-1] and value[0] in "\"'`":
+        return value[1:-1].replace("\\" + value[0], value[0])
+    return value
+
+
+def split_filter_query(filter_query):
+    """Splits a filter query on the && between its clauses, skipping those
+    inside quoted values."""
+    parts, start, quote, i = [], 0, None, 0
+    while i < len(filter_query):
+        char = filter_query[i]
+        if quote is not None:
+            if char == "\\":
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in "\"'`" and (i == 0 or filter_query[i - 1].isspace()):
+            quote = char
+        elif filter_query.startswith("&&", i):
+            parts.append(filter_query[start:i])
+            start = i + 2
+            i += 1
+        i += 1
+    parts.append(filter_query[start:])
+    return parts
+
+
+def parse_filter_query(filter_query):
+    """Returns the (column, operator, value) clauses of a DataTable filter
+    query such as '{Institution} contains "UT" && {SU's Charged} > 100'.
+    Symbols are returned as the equivalent operator names, keeping an i or s
+    case prefix as in 'sge'. Clauses that do not parse are left out, as the
+    table ignores invalid filters."""
+    clauses = []
+    for part in split_filter_query(filter_query or ""):
+        match = FILTER_CLAUSE.match(part.strip())
+        # only the blank checks take no value
+        if match is None or (match["value"] is None) != match["operator"].startswith(
+            "is "
+        ):
+            if part.strip():
+                logging.debug(f"Ignoring filter {part!r}")
+            continue
+        operator = match["operator"]
+        if operator[0] in "is" and operator[1:] in FILTER_SYMBOLS:
+            operator = operator[0] + FILTER_SYMBOLS[operator[1:]]
+        operator = FILTER_SYMBOLS.get(operator, operator)
+        value = match["value"]
+        if value is not None:
+            value = parse_filter_value(value)
+        clauses.append((match["column"], operator, value))
+    return clauses
+
+
+def filter_clause_mask(column, operator, value):
+    if operator in ("is blank", "is not blank"):
+        blank = column.isna() | (column.astype("string").str.strip() == "")
+        return blank if operator == "is blank" else ~blank
+    # an i or s prefix makes the comparison case insensitive or sensitive
+    case = not operator.startswith("i")
+    if operator[0] in "is" and operator[1:] in FILTER_OPERATORS:
+        operator = operator[1:]
+    if operator in FILTER_SYMBOLS.values():
+        # numeric columns are compared as numbers when the value is one
+        if pd.api.types.is_numeric_dtype(column):
+            try:
+                return getattr(column, operator)(float(value))
+            except ValueError:
+                pass
+        column = column.astype("string")
+        if not case:
+            column, value = column.str.lower(), value.lower()
+        return getattr(column, operator)(value)
+    text = column.astype("string")
+    if operator == "contains":
+        return text.str.contains(value, case=case, regex=False)
+    return text.str.startswith(value)
+
+
+def filter_by_query(df, filter_query):
+    """Returns the rows of df that pass a DataTable filter query."""
+    mask = np.ones(len(df), dtype=bool)
+    for column, operator, value in parse_filter_query(filter_query):
+        if column in df.columns:
+            clause = filter_clause_mask(df[column], operator, value)
+            mask &= clause.fillna(False).to_numpy(dtype=bool)
+    return df[mask]
+
+
+def get_table_view(df, sort_by=None, filter_query=None):
+    """Returns the rows of a data table, filtered and sorted as the table's
+    filter_query and sort_by ask."""
+    if filter_query:
+        df = filter_by_query(df, filter_query)
+    sort_by = [col for col in sort_by or [] if col["column_id"] in df.columns]
+    if sort_by:
+        df = df.sort_values(
+            [col["column_id"] for col in sort_by],
+            ascending=[col["direction"] == "asc" for col in sort_by],
+            kind="stable",
+            na_position="last",
+        )
+    return df
+
+
+def machine_mask(df, machines):
     if "Resource" not in df.columns.tolist():
-        return df
+        return np.ones(df.shape[0], dtype=bool)
     try:
-        df = df[df["Resource"].isin(machines)]
+        return column_isin(df["Resource"], machines)
     except Exception as ex:
         template = "An exception of type {0} occurred. Arguments:\n{1!r}"
         message = template.format(type(ex).__name__, ex.args)
         logging.debug(message)
-    return df
+    return np.ones(df.shape[0], dtype=bool)
+
+
+def calc_average_monthly_count(df, checklist):
+    """Returns the sum over the checklist of each institution's average number
+    of rows per month, over the months it has rows in."""
+    inst_grps = df.groupby(["Institution"])
+    avgs = []
+    for group in checklist:
+        try:
+            avgs.append(inst_grps.get_group((group,))["Date"].value_counts().mean())
+        except KeyError:
+            continue
+    return int(sum(avgs))
 
 
 def get_totals(DATAFRAMES, checklist, date_range, worksheets, machines):
     """Given a dictionary of dataframes, a checklist of selected universities,
     and a date range of selected months, returns a dictionary of total, active
-    and idle users in the last selected month."""
+    and idle users in the last selected month. The pages read their totals
+    from metric_cube.get_summary_totals. This is the row-based reference it is
+    tested against."""
     totals = {}
     for worksheet in worksheets:
-        df = DATAFRAMES[worksheet]
-        filtered_df = filter_df(df, checklist, date_range, machines)
-        inst_grps = filtered_df.groupby(["Institution"])
-        avgs = []
-        for group in checklist:
-            try:
-                avgs.append(inst_grps.get_group((group,))["Date"].value_counts().mean())
-            except KeyError:
-                continue
-        count = int(sum(avgs))
+        filtered_df = filter_df(DATAFRAMES[worksheet], checklist, date_range, machines)
+        count = calc_average_monthly_count(filtered_df, checklist)
 
         if worksheet == "utrc_individual_user_hpc_usage":
             totals["active_users"] = count
@@ -226,7 +593,7 @@ def get_totals(DATAFRAMES, checklist, date_range, worksheets, machines):
         elif worksheet == "utrc_active_allocations":
             totals["active_allocations"] = count
         elif worksheet == "utrc_current_allocations":
-            idle_df = filtered_df.loc[df["Idle Allocation?"] == "X"]
+            idle_df = filtered_df.loc[filtered_df["Idle Allocation?"] == "X"]
             totals["idle_allocations"] = idle_df.shape[0]
             totals["total_allocations"] = (
                 totals["idle_allocations"] + totals["active_allocations"]
@@ -252,46 +619,62 @@ def get_marks(fiscal_year):
     return marks
 
 
+def sum_by_group(df, keys, col):
+    """Returns col summed per group of keys. Each group's values are added in
+    row order like Series.sum does, because groupby's compensated sum can
+    differ in the last bit and change how sums that land on .5 round."""
+    grouped = df.groupby(keys, observed=True)
+    codes = grouped.ngroup().to_numpy()
+    order = np.argsort(codes, kind="stable")
+    values = df[col].fillna(0).to_numpy()[order]
+    bounds = np.searchsorted(codes[order], np.arange(grouped.ngroups + 1))
+    sums = [values[start:end].sum() for start, end in zip(bounds[:-1], bounds[1:])]
+    return pd.Series(sums, index=grouped.size().index, name=col, dtype="float64")
+
+
+def rows_by_institution(grouped, institutions):
+    """Given a frame indexed by institution, returns its rows in checklist
+    order. Institutions without rows are skipped."""
+    return grouped.loc[[inst for inst in institutions if inst in grouped.index]]
+
+
 def calc_monthly_avgs(df, institutions):
-    inst_grps = df.groupby(["Institution"])
-    df_with_avgs = {"Institution": [], "Date": [], "Resource": [], "Count": []}
-    for inst in institutions:
-        try:
-            monthly_avg = inst_grps.get_group((inst,))["Date"].value_counts().mean()
-            df_with_avgs["Institution"].append(inst)
-            df_with_avgs["Date"].append("AVG")
-            df_with_avgs["Count"].append(round(monthly_avg))
-            df_with_avgs["Resource"].append("ALL")
-            date_grps = inst_grps.get_group((inst,)).groupby(["Date"])
-            for date in date_grps.groups.keys():
-                machine_grps = date_grps.get_group((date,)).groupby(["Resource"])
-                for machine in machine_grps.groups:
-                    current_count = machine_grps.get_group((machine,)).shape[0]
-                    df_with_avgs["Institution"].append(inst)
-                    df_with_avgs["Resource"].append(machine)
-                    df_with_avgs["Count"].append(round(current_count))
-                    df_with_avgs["Date"].append(date)
-        except KeyError:
-            continue  # For some date ranges, even if an institution is checked, it doesn't appear in the data, throwing an error
-    df_with_avgs = pd.DataFrame(df_with_avgs)
+    monthly = df.groupby(["Institution", "Date"], observed=True).size()
+    avgs = monthly.groupby(level="Institution", observed=True).mean()
+    avgs = avgs.round().astype("int64").to_frame("Count")
+    avgs["Date"] = "AVG"
+    avgs["Resource"] = "ALL"
+    # each institution's average comes before its counts per month and machine,
+    # worksheets without machines only get the averages
+    frames = [avgs]
+    if "Resource" in df.columns:
+        counts = df.groupby(["Institution", "Date", "Resource"], observed=True).size()
+        frames.append(counts.to_frame("Count").reset_index(["Date", "Resource"]))
+    rows = rows_by_institution(pd.concat(frames), institutions)
+    df_with_avgs = pd.DataFrame(
+        {
+            "Institution": rows.index.tolist(),
+            "Date": rows["Date"].tolist(),
+            "Resource": rows["Resource"].tolist(),
+            "Count": rows["Count"].tolist(),
+        }
+    )
     df_with_avgs.sort_values(["Date", "Institution"], inplace=True)
-    logging.debug(df_with_avgs.to_string())
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(df_with_avgs.to_string())
     return df_with_avgs
 
 
 def calc_corral_monthly_sums(df, institutions):
-    inst_grps = df.groupby(["Institution"])
-    dict_with_avgs = {"Institution": [], "Date": [], "Storage Granted (TB)": []}
-    for inst in institutions:
-        try:
-            date_grps = inst_grps.get_group((inst,)).groupby(["Date"])
-            for date in date_grps.groups.keys():
-                monthly_sum = date_grps.get_group((date,))["Storage Granted (TB)"].sum()
-                dict_with_avgs["Institution"].append(inst)
-                dict_with_avgs["Storage Granted (TB)"].append(round(monthly_sum))
-                dict_with_avgs["Date"].append(date)
-        except KeyError:
-            continue
+    sums = sum_by_group(df, ["Institution", "Date"], "Storage Granted (TB)")
+    rows = rows_by_institution(
+        sums.round().to_frame().reset_index("Date"), institutions
+    )
+    dict_with_avgs = {
+        "Institution": rows.index.tolist(),
+        "Date": rows["Date"].tolist(),
+        "Storage Granted (TB)": rows["Storage Granted (TB)"].astype("int64").tolist(),
+    }
     df_with_avgs = pd.DataFrame(dict_with_avgs)
     df_with_avgs.sort_values(["Date", "Institution"], inplace=True)
     return df_with_avgs
@@ -335,23 +718,16 @@ def calc_node_monthly_sums_no_machine(df, institution):
 
 
 def calc_node_monthly_sums(df, institutions):
-    inst_grps = df.groupby(["Institution"])
-    dict_with_avgs = {"Institution": [], "Resource": [], "Date": [], "SU's Charged": []}
-    for inst in institutions:
-        try:
-            date_grps = inst_grps.get_group((inst,)).groupby(["Date"])
-            for date in date_grps.groups.keys():
-                machine_grps = date_grps.get_group((date,)).groupby(["Resource"])
-                for machine in machine_grps.groups:
-                    monthly_sum = machine_grps.get_group((machine,))[
-                        "SU's Charged"
-                    ].sum()
-                    dict_with_avgs["Institution"].append(inst)
-                    dict_with_avgs["Resource"].append(machine)
-                    dict_with_avgs["SU's Charged"].append(round(monthly_sum))
-                    dict_with_avgs["Date"].append(date)
-        except KeyError:
-            continue
+    sums = sum_by_group(df, ["Institution", "Date", "Resource"], "SU's Charged")
+    rows = rows_by_institution(
+        sums.round().to_frame().reset_index(["Date", "Resource"]), institutions
+    )
+    dict_with_avgs = {
+        "Institution": rows.index.tolist(),
+        "Resource": rows["Resource"].tolist(),
+        "Date": rows["Date"].tolist(),
+        "SU's Charged": rows["SU's Charged"].astype("int64").tolist(),
+    }
     df_with_avgs = pd.DataFrame(dict_with_avgs)
     df_with_avgs.sort_values(["Date", "Institution"], inplace=True)
     return df_with_avgs
@@ -396,22 +772,14 @@ def create_fy_options():
 
 
 def get_allocation_totals(DATAFRAMES, checklist, date_range, worksheets, machines):
+    """Row-based reference for the allocation totals of
+    metric_cube.get_summary_totals."""
     totals = {}
     for worksheet in worksheets:
-        df = DATAFRAMES[worksheet]
-        totals_df = filter_df(df, checklist, date_range, machines)
-        logging.debug(worksheet)
-        logging.debug(totals_df.head())
+        totals_df = filter_df(DATAFRAMES[worksheet], checklist, date_range, machines)
         if worksheet == "utrc_current_allocations":
             totals_df = totals_df.loc[totals_df["Idle Allocation?"] == "X"]
-        inst_grps = totals_df.groupby(["Institution"])
-        avgs = []
-        for group in checklist:
-            try:
-                avgs.append(inst_grps.get_group((group,))["Date"].value_counts().mean())
-            except KeyError:
-                continue
-        count = int(sum(avgs))
+        count = calc_average_monthly_count(totals_df, checklist)
 
         if worksheet == "utrc_active_allocations":
             totals["active_allocations"] = count
@@ -421,6 +789,19 @@ def get_allocation_totals(DATAFRAMES, checklist, date_range, worksheets, machine
     return totals
 
 
+def decode_columns(df):
+    """Categorical and Arrow columns save memory in the merged worksheets, but
+    filtered frames are handed to groupby and plotly, which expect plain
+    values."""
+    for col in df.columns[df.dtypes == "category"]:
+        df[col] = df[col].astype(object)
+    for col in df.columns[df.dtypes == "string"]:
+        df[col] = pd.Series(
+            df[col].to_numpy(dtype=object, na_value=np.nan), index=df.index
+        )
+    return df
+
+
 def sort_columns(df):
     df_columns = df.columns.tolist()
     final_order = []
@@ -0,0 +1,362 @@
+import logging
+import threading
+import time
+
+import pandas as pd
+
+from config import settings
+from src.constants import REPORTS_PATH, SHARED_CATEGORY_COLUMNS, WORKSHEETS
+from src.data_functions import (
+    filter_df,
+    filter_sorted_df,
+    get_table_view,
+    merge_workbooks,
+    sort_worksheet,
+)
+from src.dataset_cache import (
+    fingerprint_workbooks,
+    get_dataset_fingerprint,
+    get_manifest_categories,
+    prepare_dataset,
+    read_artifact_manifest,
+    read_dataset_cube,
+    read_dataset_worksheet,
+    workbooks_match,
+)
+from src.metric_cube import MetricTensor, build_cube
+from src.query_cache import QueryCache, SharedCache, normalize_filters
+from src.sql_backend import SqlBackend
+
+
+class Dataset:
+    """One version of the dataset. Worksheets, their metric cubes and tensors
+    are read the first time they are requested and never change afterwards, so
+    callbacks that hold a Dataset see the same data for their whole run, even
+    across a reload."""
+
+    def __init__(
+        self,
+        version,
+        workbooks,
+        read_worksheet,
+        read_cube,
+        sheets=None,
+        cache=None,
+        backend="pandas",
+        categories=None,
+    ):
+        self.version = version
+        self.workbooks = workbooks
+        self.fingerprint = get_dataset_fingerprint(workbooks)
+        self._read_worksheet = read_worksheet
+        self._read_cube = read_cube
+        self._cache = cache
+        self._sql = SqlBackend(self.get_sheet) if backend == "sqlite" else None
+        self._sheets = dict(sheets or {})
+        self._sort_keys = {}
+        self._cubes = {}
+        self._tensors = {}
+        self._categories = {
+            col: pd.CategoricalDtype(values)
+            for col, values in (categories or {}).items()
+        }
+        self._lock = threading.RLock()
+
+    def __getitem__(self, sheet):
+        return self.get_sheet(sheet)
+
+    def loaded_sheets(self):
+        return list(self._sheets)
+
+    def loaded_tensors(self):
+        return list(self._tensors)
+
+    def get_sheet(self, sheet):
+        df = self._sheets.get(sheet)
+        if df is not None:
+            return df
+        with self._lock:
+            if sheet not in self._sheets:
+                df = self._share_categories(self._read_worksheet(sheet))
+                df, self._sort_keys[sheet] = sort_worksheet(df)
+                self._sheets[sheet] = df
+            return self._sheets[sheet]
+
+    def get_cube(self, sheet):
+        """Returns the worksheet's metric cube, built from its rows when the
+        dataset was not read from an artifact."""
+        cube = self._cubes.get(sheet)
+        if cube is not None:
+            return cube
+        with self._lock:
+            if sheet not in self._cubes:
+                cube = self._read_cube(sheet)
+                if cube is None:
+                    cube = build_cube(self.get_sheet(sheet))
+                self._cubes[sheet] = cube
+            return self._cubes[sheet]
+
+    def get_tensor(self, sheet):
+        tensor = self._tensors.get(sheet)
+        if tensor is not None:
+            return tensor
+        with self._lock:
+            if sheet not in self._tensors:
+                self._tensors[sheet] = MetricTensor(self.get_cube(sheet))
+            return self._tensors[sheet]
+
+    def cached(self, key, compute):
+        """Returns compute() through the query cache, keyed on this dataset's
+        fingerprint and key."""
+        if self._cache is None:
+            return compute()
+        return self._cache.get((self.fingerprint, *key), compute)
+
+    def query(self, sheet, institutions, date_range, machines):
+        filters = normalize_filters(institutions, date_range, machines)
+        return self.cached(
+            ("query", sheet, *filters), lambda: self._filter(sheet, *filters)
+        )
+
+    def aggregate(self, func, sheet, institutions, date_range, machines):
+        """Returns func(tensor, institutions, date_range, machines) for the
+        worksheet's metric tensor, cached per normalized filters. Charts list
+        institutions in checklist order, so that order is part of the key."""
+        _, date_range, machines = normalize_filters(institutions, date_range, machines)
+        filters = (tuple(institutions), date_range, machines)
+        return self.cached(
+            (func.__name__, sheet, *filters),
+            lambda: func(self.get_tensor(sheet), *filters),
+        )
+
+    def table_view(self, sheet, institutions, date_range, machines, sort_by, query):
+        """Returns the filtered rows sorted and filtered further as a data
+        table's sort_by and filter query ask, cached so that paging through
+        them only slices the result."""
+        filters = normalize_filters(institutions, date_range, machines)
+        return self.rows_view(
+            ("query", sheet, *filters),
+            lambda: self._filter(sheet, *filters),
+            sort_by,
+            query,
+        )
+
+    def rows_view(self, key, compute, sort_by, query):
+        """Returns the rows compute() returns, cached under key, sorted and
+        filtered as a data table's sort_by and filter query ask."""
+        sort_key = tuple((col["column_id"], col["direction"]) for col in sort_by or [])
+        return self.cached(
+            ("table", *key, sort_key, query or ""),
+            lambda: get_table_view(self.cached(key, compute), sort_by, query),
+        )
+
+    def _filter(self, sheet, institutions, date_range, machines):
+        if self._sql is not None:
+            return self._sql.filter_df(sheet, institutions, date_range, machines)
+        df = self.get_sheet(sheet)
+        keys = self._sort_keys.get(sheet)
+        if keys is None:
+            return filter_df(df, institutions, date_range, machines)
+        return filter_sorted_df(df, keys, institutions, date_range, machines)
+
+    def _share_categories(self, df):
+        """Recodes a newly read worksheet against the categories the dataset
+        was opened with, which the manifest lists for every report, so all
+        worksheets share them. Values they lack extend them, as when the
+        worksheets were parsed without a manifest."""
+        for col in SHARED_CATEGORY_COLUMNS:
+            if col not in df.columns:
+                continue
+            dtype = self._categories.get(col)
+            values = set(df[col].dropna().unique())
+            if dtype is None or not values.issubset(dtype.categories):
+                if dtype is not None:
+                    values.update(dtype.categories)
+                dtype = pd.CategoricalDtype(sorted(values, key=str))
+                self._categories[col] = dtype
+            df[col] = df[col].astype(dtype)
+        return df
+
+
+class DataStore:
+    """Serves the current Dataset and swaps in a new version when the monthly
+    reports change. Callbacks should take one snapshot and use it throughout."""
+
+    def __init__(
+        self,
+        WORKSHEETS,
+        cache_dir,
+        reports_path=REPORTS_PATH,
+        workers=None,
+        query_cache_mb=None,
+        shared_cache_path=None,
+        shared_cache_mb=None,
+        backend="pandas",
+    ):
+        self.WORKSHEETS = WORKSHEETS
+        self.cache_dir = cache_dir
+        self.reports_path = reports_path
+        self.workers = workers
+        self.backend = backend
+        self.query_cache = None
+        if query_cache_mb:
+            shared = None
+            if shared_cache_path and shared_cache_mb:
+                shared = SharedCache(shared_cache_path, shared_cache_mb * 1024 * 1024)
+            self.query_cache = QueryCache(query_cache_mb * 1024 * 1024, shared)
+        self._dataset = None
+        self._lock = threading.Lock()
+        self._watcher = None
+
+    @property
+    def version(self):
+        return self.snapshot().version
+
+    def snapshot(self):
+        dataset = self._dataset
+        if dataset is not None:
+            return dataset
+        with self._lock:
+            if self._dataset is None:
+                self._dataset = self._open(1)
+                self._retain_results(self._dataset)
+            return self._dataset
+
+    def get_sheet(self, sheet):
+        return self.snapshot().get_sheet(sheet)
+
+    def get_cube(self, sheet):
+        return self.snapshot().get_cube(sheet)
+
+    def get_tensor(self, sheet):
+        return self.snapshot().get_tensor(sheet)
+
+    def query(self, sheet, institutions, date_range, machines):
+        return self.snapshot().query(sheet, institutions, date_range, machines)
+
+    def preload(self, sheets=(), tensors=()):
+        dataset = self.snapshot()
+        for sheet in sheets:
+            dataset.get_sheet(sheet)
+        for sheet in tensors:
+            dataset.get_tensor(sheet)
+
+    def _open(self, version):
+        try:
+            manifest = prepare_dataset(
+                self.WORKSHEETS, self.cache_dir, self.reports_path, self.workers
+            )
+        except (OSError, ValueError) as ex:
+            logging.warning(f"Dataset cache in {self.cache_dir} is unusable: {ex}")
+            sheets = merge_workbooks(self.WORKSHEETS, self.reports_path, self.workers)
+            workbooks = fingerprint_workbooks(self.reports_path)
+            return Dataset(
+                version,
+                workbooks,
+                self._parse_worksheet,
+                lambda sheet: None,
+                sheets,
+                self.query_cache,
+                self.backend,
+            )
+        return self._open_manifest(version, manifest)
+
+    def _open_manifest(self, version, manifest):
+        def read_worksheet(sheet):
+            try:
+                return read_dataset_worksheet(self.cache_dir, manifest, sheet)
+            except (OSError, ValueError) as ex:
+                logging.warning(f"Could not read {sheet} from the cache: {ex}")
+                return self._parse_worksheet(sheet)
+
+        def read_cube(sheet):
+            try:
+                return read_dataset_cube(self.cache_dir, manifest, sheet)
+            except (OSError, ValueError) as ex:
+                logging.warning(f"Could not read the {sheet} cube: {ex}")
+                return None
+
+        return Dataset(
+            version,
+            manifest["workbooks"],
+            read_worksheet,
+            read_cube,
+            cache=self.query_cache,
+            backend=self.backend,
+            categories=get_manifest_categories(manifest),
+        )
+
+    def _parse_worksheet(self, sheet):
+        return merge_workbooks([sheet], self.reports_path, self.workers)[sheet]
+
+    def reload(self, ingest=True):
+        """Swaps in a new version of the dataset if reports were added, changed
+        or removed since the current one was opened. The worksheets and tensors
+        loaded in the current version are read before the swap. Without ingest,
+        reports are never parsed in this process, and the new version is only
+        opened once a dataset artifact was built from them. Returns True when
+        it swapped."""
+        with self._lock:
+            current = self._dataset
+            if current is None:
+                return False
+            workbooks = fingerprint_workbooks(self.reports_path, current.workbooks)
+            if workbooks_match(current.workbooks, workbooks):
+                return False
+            if ingest:
+                dataset = self._open(current.version + 1)
+            else:
+                manifest = read_artifact_manifest(
+                    self.WORKSHEETS, self.cache_dir, self.reports_path
+                )
+                if manifest is None:
+                    logging.debug("Reports changed, waiting for their artifact")
+                    return False
+                dataset = self._open_manifest(current.version + 1, manifest)
+            for sheet in current.loaded_sheets():
+                dataset.get_sheet(sheet)
+            for sheet in current.loaded_tensors():
+                dataset.get_tensor(sheet)
+            self._dataset = dataset
+        self._retain_results(dataset)
+        logging.info(f"Reloaded dataset as version {dataset.version}")
+        return True
+
+    def _retain_results(self, dataset):
+        # results of other versions of the dataset can no longer be requested
+        if self.query_cache is not None:
+            self.query_cache.retain(dataset.fingerprint)
+
+    def _watch_reports(self, interval, ingest):
+        while True:
+            time.sleep(interval)
+            try:
+                self.reload(ingest)
+            except Exception:
+                logging.exception("Failed to reload dataset, keeping the current one")
+
+    def start_watcher(self, interval=settings["RELOAD_INTERVAL"], ingest=True):
+        """Starts a background thread in this process that checks the reports
+        directory every interval seconds and reloads as reload(ingest) does.
+        Threads do not survive a fork, so each gunicorn worker starts its own,
+        without ingest, and src.ingest.watch_reports parses the reports."""
+        if not interval or (self._watcher is not None and self._watcher.is_alive()):
+            return
+        self._watcher = threading.Thread(
+            target=self._watch_reports,
+            args=(interval, ingest),
+            name="dataset-reload",
+            daemon=True,
+        )
+        self._watcher.start()
+
+
+STORE = DataStore(
+    WORKSHEETS,
+    settings["DATASET_CACHE_DIR"],
+    workers=settings["INGEST_WORKERS"],
+    query_cache_mb=settings["QUERY_CACHE_MB"],
+    shared_cache_path=settings["SHARED_CACHE_PATH"],
+    shared_cache_mb=settings["SHARED_CACHE_MB"],
+    backend=settings["QUERY_BACKEND"],
+)
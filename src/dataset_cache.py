@@ -0,0 +1,342 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+from contextlib import contextmanager
+
+import pandas as pd
+
+from src.constants import REPORTS_PATH, SHARED_CATEGORY_COLUMNS
+from src.data_functions import (
+    INSTITUTION_ALIASES,
+    get_workbook_paths,
+    materialize_worksheet,
+    merge_workbooks,
+    parse_workbooks,
+    share_categories,
+    sort_worksheet,
+)
+from src.metric_cube import build_cube
+from src.version import version
+
+# Bump whenever the cleaning pipeline changes the shape of the cached data
+CACHE_FORMAT = 6
+MANIFEST_FILENAME = "manifest.json"
+ALIASES_FILENAME = "institution_aliases.json"
+ARTIFACT_DIRNAME = "artifact"
+
+
+def get_workbook_fingerprint(path, previous=None):
+    """Returns the size, mtime and content hash of a workbook. The hash of a
+    previous fingerprint is reused when the size and mtime have not changed."""
+    stat = os.stat(path)
+    fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if (
+        previous is not None
+        and previous["size"] == fingerprint["size"]
+        and previous["mtime_ns"] == fingerprint["mtime_ns"]
+    ):
+        fingerprint["sha256"] = previous["sha256"]
+        return fingerprint
+
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    fingerprint["sha256"] = sha256.hexdigest()
+    return fingerprint
+
+
+def fingerprint_workbooks(reports_path, previous=None):
+    """Returns a dictionary of workbook filenames to fingerprints."""
+    previous = previous or {}
+    fingerprints = {}
+    for path in sorted(get_workbook_paths(reports_path)):
+        filename = path.split("/")[-1]
+        fingerprints[filename] = get_workbook_fingerprint(path, previous.get(filename))
+    return fingerprints
+
+
+def fingerprint_matches(cached, current):
+    same_stat = (
+        cached["size"] == current["size"] and cached["mtime_ns"] == current["mtime_ns"]
+    )
+    return same_stat or cached["sha256"] == current["sha256"]
+
+
+def workbooks_match(cached, current):
+    return cached.keys() == current.keys() and all(
+        fingerprint_matches(cached[f], current[f]) for f in current
+    )
+
+
+def get_dataset_fingerprint(workbooks):
+    """Returns a short hash of the workbooks' contents and the app version,
+    which is the same in every process that loaded the same reports."""
+    hashes = {filename: workbooks[filename]["sha256"] for filename in workbooks}
+    payload = json.dumps([version, hashes], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, MANIFEST_FILENAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load_institution_aliases(cache_dir):
+    """Seeds the fuzzy-match table with aliases resolved by earlier ingests."""
+    try:
+        with open(os.path.join(cache_dir, ALIASES_FILENAME)) as f:
+            INSTITUTION_ALIASES.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+
+
+def save_institution_aliases(cache_dir):
+    write_json_atomic(os.path.join(cache_dir, ALIASES_FILENAME), INSTITUTION_ALIASES)
+
+
+def new_manifest(WORKSHEETS):
+    return {
+        "format": CACHE_FORMAT,
+        "version": version,
+        "worksheets": sorted(WORKSHEETS),
+        "workbooks": {},
+    }
+
+
+def manifest_is_compatible(manifest, WORKSHEETS):
+    return (
+        manifest is not None
+        and manifest.get("format") == CACHE_FORMAT
+        and manifest.get("version") == version
+        and set(WORKSHEETS).issubset(manifest.get("worksheets", []))
+    )
+
+
+def get_workbook_categories(workbook):
+    """Returns the values of the shared category columns in a parsed
+    workbook's worksheets."""
+    categories = {}
+    for df in workbook.values():
+        for col in SHARED_CATEGORY_COLUMNS:
+            if col in df.columns:
+                values = categories.setdefault(col, set())
+                values.update(df[col].dropna().unique().tolist())
+    return {col: sorted(values, key=str) for col, values in categories.items()}
+
+
+def get_manifest_categories(manifest):
+    """Returns the sorted values of each shared category column across the
+    manifest's workbooks, or None when it does not list them."""
+    workbooks = manifest.get("categories", {})
+    if any(filename not in workbooks for filename in manifest["workbooks"]):
+        return None
+    categories = {}
+    for filename in manifest["workbooks"]:
+        for col, values in workbooks[filename].items():
+            categories.setdefault(col, set()).update(values)
+    return {col: sorted(values, key=str) for col, values in categories.items()}
+
+
+def get_part_path(cache_dir, worksheet, filename):
+    """Each workbook's rows are stored in their own file within a worksheet's
+    directory, so adding a report never rewrites the existing history."""
+    return os.path.join(cache_dir, worksheet, filename.replace(".xlsx", ".parquet"))
+
+
+def stringify_mixed_columns(df):
+    """Parquet columns must hold a single type, but some report columns mix
+    numbers and strings. Those columns are stored as strings."""
+    for col in df.select_dtypes(include="object").columns:
+        if pd.api.types.infer_dtype(df[col], skipna=True) in ("mixed", "mixed-integer"):
+            df[col] = df[col].map(lambda x: x if pd.isna(x) else str(x))
+    return df
+
+
+def write_part(df, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    stringify_mixed_columns(df.copy()).to_parquet(tmp_path, engine="pyarrow")
+    os.replace(tmp_path, path)
+
+
+def remove_part(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+@contextmanager
+def cache_lock(cache_dir):
+    """Serializes ingestion between processes sharing a cache directory."""
+    lock_path = os.path.normpath(cache_dir) + ".lock"
+    os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+    with open(lock_path, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def ingest_workbooks(WORKSHEETS, cache_dir, reports_path=REPORTS_PATH, workers=None):
+    """Brings the cache up to date with the monthly reports, parsing only
+    workbooks that are new or changed since the last ingest. Returns the
+    manifest of ingested workbooks."""
+    with cache_lock(cache_dir):
+        manifest = read_manifest(cache_dir)
+        if not manifest_is_compatible(manifest, WORKSHEETS):
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            manifest = new_manifest(WORKSHEETS)
+        ingested = manifest["workbooks"]
+        fingerprints = fingerprint_workbooks(reports_path, ingested)
+
+        removed = [f for f in ingested if f not in fingerprints]
+        changed = [
+            f
+            for f, fingerprint in fingerprints.items()
+            if f not in ingested or not fingerprint_matches(ingested[f], fingerprint)
+        ]
+        if not removed and not changed and fingerprints == ingested:
+            return manifest
+
+        os.makedirs(cache_dir, exist_ok=True)
+        load_institution_aliases(cache_dir)
+        known_aliases = len(INSTITUTION_ALIASES)
+        categories = manifest.setdefault("categories", {})
+        for filename in removed:
+            logging.info(f"Removing {filename} from {cache_dir}")
+            categories.pop(filename, None)
+            for sheet in manifest["worksheets"]:
+                remove_part(get_part_path(cache_dir, sheet, filename))
+        paths = [os.path.join(reports_path, filename) for filename in changed]
+        workbooks = parse_workbooks(paths, manifest["worksheets"], workers)
+        for filename, workbook in zip(changed, workbooks):
+            categories[filename] = get_workbook_categories(workbook)
+            for sheet in manifest["worksheets"]:
+                write_part(workbook[sheet], get_part_path(cache_dir, sheet, filename))
+        if len(INSTITUTION_ALIASES) != known_aliases:
+            save_institution_aliases(cache_dir)
+        manifest["workbooks"] = fingerprints
+        write_json_atomic(os.path.join(cache_dir, MANIFEST_FILENAME), manifest)
+        logging.info(
+            f"Ingested {len(changed)} new or changed workbooks into {cache_dir}"
+        )
+        return manifest
+
+
+def read_worksheet(cache_dir, worksheet, filenames):
+    parts = [
+        pd.read_parquet(get_part_path(cache_dir, worksheet, filename))
+        for filename in filenames
+    ]
+    return materialize_worksheet(parts)
+
+
+def get_artifact_path(cache_dir, worksheet, suffix=".parquet"):
+    return os.path.join(cache_dir, ARTIFACT_DIRNAME, f"{worksheet}{suffix}")
+
+
+def write_artifact(cache_dir, manifest):
+    """Compacts the cached parts into one zstd-compressed file per worksheet,
+    so loading a worksheet takes a single read rather than one per workbook,
+    and stores each worksheet's metric cube next to it. Worksheets are stored
+    sorted by month and institution, so loading them does not sort. The artifact is built
+    in a temporary directory and moved into place."""
+    artifact_dir = os.path.join(cache_dir, ARTIFACT_DIRNAME)
+    tmp_dir = f"{artifact_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    filenames = sorted(manifest["workbooks"])
+    categories = get_manifest_categories(manifest) or {}
+    for sheet in manifest["worksheets"]:
+        df = read_worksheet(cache_dir, sheet, filenames)
+        # cubes are coded against the categories the app loads worksheets with
+        for col, values in categories.items():
+            if col in df.columns:
+                df[col] = df[col].astype(pd.CategoricalDtype(values))
+        df, _ = sort_worksheet(df)
+        build_cube(df).to_parquet(
+            os.path.join(tmp_dir, f"{sheet}.cube.parquet"),
+            engine="pyarrow",
+            compression="zstd",
+        )
+        stringify_mixed_columns(df).to_parquet(
+            os.path.join(tmp_dir, f"{sheet}.parquet"),
+            engine="pyarrow",
+            compression="zstd",
+        )
+    write_json_atomic(
+        os.path.join(tmp_dir, MANIFEST_FILENAME), {**manifest, "artifact": True}
+    )
+    shutil.rmtree(artifact_dir, ignore_errors=True)
+    os.replace(tmp_dir, artifact_dir)
+
+
+def read_artifact_manifest(WORKSHEETS, cache_dir, reports_path=REPORTS_PATH):
+    """Returns the manifest of the artifact, or None when there is no artifact
+    or it was built from different reports."""
+    manifest = read_manifest(os.path.join(cache_dir, ARTIFACT_DIRNAME))
+    if not manifest_is_compatible(manifest, WORKSHEETS):
+        return None
+    fingerprints = fingerprint_workbooks(reports_path, manifest["workbooks"])
+    if not workbooks_match(manifest["workbooks"], fingerprints):
+        return None
+    return manifest
+
+
+def prepare_dataset(WORKSHEETS, cache_dir, reports_path=REPORTS_PATH, workers=None):
+    """Returns the manifest of the artifact when it matches the reports, and
+    otherwise the manifest of the cache after ingesting any workbooks that
+    were added or changed since the last start."""
+    manifest = read_artifact_manifest(WORKSHEETS, cache_dir, reports_path)
+    if manifest is None:
+        manifest = ingest_workbooks(WORKSHEETS, cache_dir, reports_path, workers)
+    return manifest
+
+
+def read_dataset_worksheet(cache_dir, manifest, worksheet):
+    if manifest.get("artifact"):
+        path = get_artifact_path(cache_dir, worksheet)
+        return materialize_worksheet([pd.read_parquet(path)])
+    return read_worksheet(cache_dir, worksheet, sorted(manifest["workbooks"]))
+
+
+def read_dataset_cube(cache_dir, manifest, worksheet):
+    """Returns the worksheet's metric cube from the artifact, or None when the
+    dataset is read from the per-workbook parts."""
+    if not manifest.get("artifact"):
+        return None
+    return pd.read_parquet(get_artifact_path(cache_dir, worksheet, ".cube.parquet"))
+
+
+def load_dataset(WORKSHEETS, cache_dir, reports_path=REPORTS_PATH, workers=None):
+    """Returns merged worksheets from the dataset artifact or the on-disk
+    cache, falling back to parsing every workbook if the cache is unusable."""
+    try:
+        manifest = prepare_dataset(WORKSHEETS, cache_dir, reports_path, workers)
+        dataframes = share_categories(
+            {
+                sheet: read_dataset_worksheet(cache_dir, manifest, sheet)
+                for sheet in WORKSHEETS
+            }
+        )
+    except (OSError, ValueError) as ex:
+        logging.warning(f"Dataset cache in {cache_dir} is unusable: {ex}")
+        return merge_workbooks(WORKSHEETS, reports_path, workers)
+    logging.info(f"Loaded {len(WORKSHEETS)} worksheets from {cache_dir}")
+    return dataframes
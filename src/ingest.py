@@ -0,0 +1,76 @@
+"""Parses the monthly reports into the dataset cache and compacts them into
+the artifact the app loads at startup. Exits with an error if any report
+cannot be parsed.
+
+    python -m src.ingest
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+from config import settings
+from src.constants import REPORTS_PATH, WORKSHEETS
+from src.dataset_cache import (
+    ingest_workbooks,
+    read_artifact_manifest,
+    write_artifact,
+)
+
+
+def build_artifact(cache_dir, reports_path=REPORTS_PATH, workers=None):
+    manifest = ingest_workbooks(WORKSHEETS, cache_dir, reports_path, workers)
+    if not manifest["workbooks"]:
+        raise ValueError(f"No reports found in {reports_path}")
+    write_artifact(cache_dir, manifest)
+    return manifest
+
+
+def watch_reports(
+    interval,
+    cache_dir=settings["DATASET_CACHE_DIR"],
+    reports_path=REPORTS_PATH,
+    workers=settings["INGEST_WORKERS"],
+):
+    """Rebuilds the artifact every interval seconds when the reports changed,
+    for the app's workers to reload. gunicorn runs it in one process next to
+    the workers, so reports are parsed once, and stops with its parent."""
+    logging.basicConfig(level=logging.INFO)
+    parent = os.getppid()
+    while os.getppid() == parent:
+        time.sleep(interval)
+        try:
+            if read_artifact_manifest(WORKSHEETS, cache_dir, reports_path) is None:
+                manifest = build_artifact(cache_dir, reports_path, workers)
+                logging.info(
+                    f"Rebuilt dataset artifact from {len(manifest['workbooks'])} "
+                    "reports"
+                )
+        except Exception:
+            logging.exception("Failed to ingest the monthly reports")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reports-path", default=REPORTS_PATH)
+    parser.add_argument("--cache-dir", default=settings["DATASET_CACHE_DIR"])
+    parser.add_argument("--workers", type=int, default=settings["INGEST_WORKERS"])
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    try:
+        manifest = build_artifact(args.cache_dir, args.reports_path, args.workers)
+    except Exception:
+        logging.exception("Failed to ingest the monthly reports")
+        return 1
+    logging.info(
+        f"Built dataset artifact from {len(manifest['workbooks'])} reports "
+        f"in {args.cache_dir}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
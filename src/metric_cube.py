@@ -0,0 +1,251 @@
+import numpy as np
+import pandas as pd
+
+from src.data_functions import add_peaks_to_corral_df
+
+CUBE_KEYS = ["Institution", "Resource", "Date"]
+CUBE_SUMS = ["SU's Charged", "Storage Granted (TB)"]
+
+# the worksheet and cube metric behind each summary panel value, which is
+# averaged over the months in the date range
+SUMMARY_METRICS = {
+    "active_users": ("utrc_individual_user_hpc_usage", "Count"),
+    "idle_users": ("utrc_idle_users", "Count"),
+    "active_allocations": ("utrc_active_allocations", "Count"),
+    "idle_allocations": ("utrc_current_allocations", "Idle Count"),
+}
+
+
+def build_cube(df):
+    """Returns the row count and the sums of a worksheet per institution,
+    resource and month, plus the number of idle allocations where the
+    worksheet flags them. Charts and summary panels are computed from this
+    instead of the raw rows."""
+    keys = [col for col in CUBE_KEYS if col in df.columns]
+    grouped = df.groupby(keys, observed=True, sort=True)
+    cube = grouped.size().to_frame("Count")
+    for col in CUBE_SUMS:
+        if col in df.columns:
+            cube[col] = grouped[col].sum()
+    if "Idle Allocation?" in df.columns:
+        idle = df["Idle Allocation?"] == "X"
+        by = [df[key] for key in keys]
+        cube["Idle Count"] = idle.groupby(by, observed=True).sum()
+    return cube.reset_index()
+
+
+class MetricTensor:
+    """A worksheet's cube as dense arrays indexed [institution, resource,
+    month], with prefix sums along the month axis so the total over a
+    contiguous range of months is the difference of two slices. Worksheets
+    without a Resource column have a single resource slot that every
+    machine filter selects."""
+
+    def __init__(self, cube):
+        self.institutions = get_axis(cube, "Institution")
+        self.months = get_axis(cube, "Date")
+        if "Resource" in cube.columns:
+            self.resources = get_axis(cube, "Resource")
+            resource_index = self.resources.get_indexer(cube["Resource"])
+        else:
+            self.resources = None
+            resource_index = np.zeros(len(cube), dtype=np.intp)
+        shape = (
+            len(self.institutions),
+            1 if self.resources is None else len(self.resources),
+            len(self.months),
+        )
+        index = (
+            self.institutions.get_indexer(cube["Institution"]),
+            resource_index,
+            self.months.get_indexer(cube["Date"]),
+        )
+        self.values = {}
+        self.prefix = {}
+        for metric in ["Count", "Idle Count"] + CUBE_SUMS:
+            if metric not in cube.columns:
+                continue
+            dtype = np.float64 if metric in CUBE_SUMS else np.int64
+            values = np.zeros(shape, dtype=dtype)
+            values[index] = cube[metric].to_numpy(dtype=dtype)
+            prefix = np.zeros(shape[:2] + (shape[2] + 1,), dtype=dtype)
+            np.cumsum(values, axis=2, out=prefix[:, :, 1:])
+            self.values[metric] = values
+            self.prefix[metric] = prefix
+
+    def select(self, institutions, date_range, machines):
+        """Returns the positions of the selected institutions in the order
+        they were given, and of the selected resources and months in axis
+        order. Values that are not in the worksheet are left out."""
+        inst = self.institutions.get_indexer(institutions)
+        months = self.months.get_indexer(date_range)
+        if self.resources is None:
+            resources = np.zeros(1, dtype=np.intp)
+        else:
+            resources = self.resources.get_indexer(machines)
+            resources = np.unique(resources[resources >= 0])
+        return inst[inst >= 0], resources, np.unique(months[months >= 0])
+
+    def slice(self, metric, selection):
+        inst, resources, months = selection
+        return self.values[metric][np.ix_(inst, resources, months)]
+
+    def range_total(self, metric, selection):
+        """Returns each selected institution's total over the selected months,
+        from the prefix sums when the months are contiguous."""
+        inst, resources, months = selection
+        if len(months) == 0 or months[-1] - months[0] + 1 != len(months):
+            return self.slice(metric, selection).sum(axis=(1, 2))
+        prefix = self.prefix[metric][np.ix_(inst, resources)]
+        return (prefix[:, :, months[-1] + 1] - prefix[:, :, months[0]]).sum(axis=1)
+
+
+def get_axis(cube, col):
+    return pd.Index(sorted(cube[col].dropna().unique().tolist()))
+
+
+def rounded(values):
+    return np.round(values).astype("int64").tolist()
+
+
+def calc_average_monthly_total(tensor, metric, selection):
+    """Returns the sum over the selected institutions of their average monthly
+    metric, averaged over the months in which it is not zero."""
+    months_present = (tensor.slice(metric, selection).sum(axis=1) > 0).sum(axis=1)
+    totals = tensor.range_total(metric, selection)
+    present = months_present > 0
+    return int(sum((totals[present] / months_present[present]).tolist()))
+
+
+def calc_range_total(tensor, metric, institutions, date_range, machines):
+    """Returns the metric summed over the filtered rows."""
+    inst, resources, months = tensor.select(institutions, date_range, machines)
+    return tensor.range_total(metric, (np.unique(inst), resources, months)).sum()
+
+
+def calc_cube_monthly_avgs(tensor, institutions, date_range, machines):
+    """Same result as calc_monthly_avgs on the filtered rows."""
+    selection = tensor.select(institutions, date_range, machines)
+    counts = tensor.slice("Count", selection)
+    monthly = counts.sum(axis=1)
+    months_present = (monthly > 0).sum(axis=1)
+    df_with_avgs = {"Institution": [], "Date": [], "Resource": [], "Count": []}
+    for i, inst in enumerate(tensor.institutions[selection[0]]):
+        if months_present[i] == 0:
+            continue
+        df_with_avgs["Institution"].append(inst)
+        df_with_avgs["Date"].append("AVG")
+        df_with_avgs["Count"].append(round(monthly[i].sum() / months_present[i]))
+        df_with_avgs["Resource"].append("ALL")
+        if tensor.resources is None:
+            continue
+        months, resources = np.nonzero(counts[i].T)
+        df_with_avgs["Institution"].extend([inst] * len(months))
+        df_with_avgs["Resource"].extend(
+            tensor.resources[selection[1][resources]].tolist()
+        )
+        df_with_avgs["Count"].extend(counts[i].T[months, resources].tolist())
+        df_with_avgs["Date"].extend(tensor.months[selection[2][months]].tolist())
+    df_with_avgs = pd.DataFrame(df_with_avgs)
+    df_with_avgs.sort_values(["Date", "Institution"], inplace=True)
+    return df_with_avgs
+
+
+def calc_cube_monthly_counts(tensor, institutions, date_range, machines):
+    """Returns the number of filtered rows per institution and month, and an
+    AVG row per institution with its average over the months it has rows in,
+    rounded down."""
+    selection = tensor.select(institutions, date_range, machines)
+    monthly = tensor.slice("Count", selection).sum(axis=1)
+    # an institution picked twice is counted once
+    _, rows = np.unique(selection[0], return_index=True)
+    df_with_avgs = {"Institution": [], "Date": [], "Count": []}
+    for i in rows:
+        months = np.nonzero(monthly[i])[0]
+        if len(months) == 0:
+            continue
+        inst = tensor.institutions[selection[0][i]]
+        df_with_avgs["Institution"].extend([inst] * (len(months) + 1))
+        df_with_avgs["Date"].extend(tensor.months[selection[2][months]].tolist())
+        df_with_avgs["Date"].append("AVG")
+        df_with_avgs["Count"].extend(monthly[i, months].tolist())
+        df_with_avgs["Count"].append(int(monthly[i].sum() / len(months)))
+    df_with_avgs = pd.DataFrame(df_with_avgs)
+    df_with_avgs.sort_values(["Date", "Institution"], inplace=True)
+    return df_with_avgs
+
+
+def calc_cube_corral_monthly_sums(tensor, institutions, date_range, machines):
+    """Same result as calc_corral_monthly_sums on the filtered rows."""
+    selection = tensor.select(institutions, date_range, machines)
+    present = tensor.slice("Count", selection).sum(axis=1) > 0
+    storage = tensor.slice("Storage Granted (TB)", selection).sum(axis=1)
+    dict_with_avgs = {"Institution": [], "Date": [], "Storage Granted (TB)": []}
+    for i, inst in enumerate(tensor.institutions[selection[0]]):
+        months = np.nonzero(present[i])[0]
+        dict_with_avgs["Institution"].extend([inst] * len(months))
+        dict_with_avgs["Storage Granted (TB)"].extend(rounded(storage[i, months]))
+        dict_with_avgs["Date"].extend(tensor.months[selection[2][months]].tolist())
+    df_with_avgs = pd.DataFrame(dict_with_avgs)
+    df_with_avgs.sort_values(["Date", "Institution"], inplace=True)
+    return df_with_avgs
+
+
+def calc_cube_corral_monthly_sums_with_peaks(
+    tensor, institutions, date_range, machines
+):
+    df_with_avgs = calc_cube_corral_monthly_sums(
+        tensor, institutions, date_range, machines
+    )
+    return add_peaks_to_corral_df(df_with_avgs, institutions)
+
+
+def calc_cube_node_monthly_sums(tensor, institutions, date_range, machines):
+    """Same result as calc_node_monthly_sums on the filtered rows."""
+    selection = tensor.select(institutions, date_range, machines)
+    counts = tensor.slice("Count", selection)
+    sus = tensor.slice("SU's Charged", selection)
+    dict_with_avgs = {"Institution": [], "Resource": [], "Date": [], "SU's Charged": []}
+    for i, inst in enumerate(tensor.institutions[selection[0]]):
+        months, resources = np.nonzero(counts[i].T)
+        dict_with_avgs["Institution"].extend([inst] * len(months))
+        dict_with_avgs["Resource"].extend(
+            tensor.resources[selection[1][resources]].tolist()
+        )
+        dict_with_avgs["SU's Charged"].extend(rounded(sus[i].T[months, resources]))
+        dict_with_avgs["Date"].extend(tensor.months[selection[2][months]].tolist())
+    df_with_avgs = pd.DataFrame(dict_with_avgs)
+    df_with_avgs.sort_values(["Date", "Institution"], inplace=True)
+    return df_with_avgs
+
+
+def calc_cube_node_monthly_sums_no_machine(tensor, institution, date_range, machines):
+    """Same result as calc_node_monthly_sums_no_machine on the rows filtered
+    to one institution."""
+    selection = tensor.select([institution], date_range, machines)
+    present = np.nonzero(tensor.slice("Count", selection).sum(axis=(0, 1)))[0]
+    sus = tensor.slice("SU's Charged", selection).sum(axis=(0, 1))
+    dict_with_avgs = {
+        "Institution": [institution] * len(present),
+        "Date": tensor.months[selection[2][present]].tolist(),
+        "SU's Charged": rounded(sus[present]),
+    }
+    df_with_avgs = pd.DataFrame(dict_with_avgs)
+    df_with_avgs.sort_values(["Date", "Institution"], inplace=True)
+    return df_with_avgs
+
+
+def get_summary_totals(dataset, metrics, checklist, date_range, machines):
+    """Returns the summary panel values named in metrics. Each worksheet's
+    cells are selected once for all the metrics read from it."""
+    by_worksheet = {}
+    for name in metrics:
+        worksheet, metric = SUMMARY_METRICS[name]
+        by_worksheet.setdefault(worksheet, []).append((name, metric))
+    totals = {}
+    for worksheet, sheet_metrics in by_worksheet.items():
+        tensor = dataset.get_tensor(worksheet)
+        selection = tensor.select(checklist, date_range, machines)
+        for name, metric in sheet_metrics:
+            totals[name] = calc_average_monthly_total(tensor, metric, selection)
+    return {name: totals[name] for name in metrics}
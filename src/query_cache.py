@@ -0,0 +1,207 @@
+import logging
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def normalize_filters(institutions, date_range, machines):
+    """Returns the filter values as sorted tuples without duplicates, so
+    selections that differ only in the order values were picked share a
+    cache entry."""
+    return (
+        tuple(sorted(set(institutions))),
+        tuple(sorted(set(date_range))),
+        tuple(sorted(set(machines))),
+    )
+
+
+def get_result_size(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    return sys.getsizeof(value)
+
+
+class SharedCache:
+    """Pickled results shared by the workers on one host through a SQLite
+    database, holding at most max_bytes and dropping the least recently used
+    entries first. Put it in /dev/shm to keep it in memory. Errors are logged
+    and treated as misses, so a broken cache only costs the recomputation.
+    Versions are ordered by when they were first retained, so during a reload
+    workers still on the previous version do not drop the results of the new
+    one."""
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._connection = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # connections do not survive a fork, so each worker opens its own
+        if self._pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=10, isolation_level=None, check_same_thread=False
+            )
+            # only results written by this user are unpickled
+            if os.stat(self.path).st_uid != os.getuid():
+                connection.close()
+                raise PermissionError(f"{self.path} belongs to another user")
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, "
+                "version TEXT NOT NULL, value BLOB NOT NULL, "
+                "size INTEGER NOT NULL, used REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS versions "
+                "(version TEXT PRIMARY KEY, seen REAL NOT NULL)"
+            )
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            try:
+                return self._connect().execute(sql, params).fetchall()
+            except (sqlite3.Error, OSError) as ex:
+                logging.warning(f"Shared cache {self.path} failed: {ex}")
+                return None
+
+    def get(self, key):
+        rows = self._execute("SELECT value FROM results WHERE key = ?", (key,))
+        if not rows:
+            return None
+        self._execute("UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+        return rows[0][0]
+
+    def put(self, version, key, value):
+        # it would be evicted right away
+        if len(value) > self.max_bytes:
+            return
+        self._execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+            (key, version, value, len(value), time.time()),
+        )
+        # keep the most recently used entries that fit in the budget
+        self._execute(
+            "DELETE FROM results WHERE key IN (SELECT key FROM (SELECT key, "
+            "SUM(size) OVER (ORDER BY used DESC) AS total FROM results) "
+            "WHERE total > ?)",
+            (self.max_bytes,),
+        )
+
+    def retain(self, version):
+        """Drops the results of versions retained before version, and of those
+        never retained."""
+        self._execute(
+            "INSERT OR IGNORE INTO versions VALUES (?, ?)", (version, time.time())
+        )
+        self._execute(
+            "DELETE FROM results WHERE version != ? AND COALESCE((SELECT seen "
+            "FROM versions WHERE versions.version = results.version), 0) <= "
+            "(SELECT seen FROM versions WHERE version = ?)",
+            (version, version),
+        )
+
+    def stats(self):
+        rows = self._execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results")
+        entries, size = rows[0] if rows else (0, 0)
+        return {"shared_entries": entries, "shared_bytes": size}
+
+
+class QueryCache:
+    """Least recently used cache of query and chart results in one worker,
+    holding at most max_bytes of results. Keys start with the fingerprint of
+    the dataset they were computed from, so results of a replaced dataset are
+    never served. With a SharedCache, misses are looked up in it before
+    computing, and computed results are added to it. Cached frames are shared
+    between callbacks and must not be modified."""
+
+    def __init__(self, max_bytes, shared=None):
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self.bytes = 0
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        """Returns the cached result for key, calling compute() on a miss.
+        Results larger than the whole budget are returned without caching."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        value = self._get_shared(key, compute)
+        size = get_result_size(value)
+        if size > self.max_bytes:
+            return value
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (value, size)
+                self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+        return value
+
+    def _get_shared(self, key, compute):
+        blob = self.shared.get(repr(key)) if self.shared is not None else None
+        if blob is not None:
+            with self._lock:
+                self.shared_hits += 1
+            return pickle.loads(blob)  # nosec B301 - written by this user's workers
+        with self._lock:
+            self.misses += 1
+        value = compute()
+        if self.shared is not None:
+            self.shared.put(key[0], repr(key), pickle.dumps(value))
+        return value
+
+    def retain(self, version):
+        """Drops the results of every dataset but version, and those of
+        datasets older than version from the shared cache."""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+        if self.shared is not None:
+            self.shared.retain(version)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+            }
+        if self.shared is not None:
+            stats.update(self.shared.stats())
+        return stats
+
+
+def format_stats(stats, pid):
+    """Returns a QueryCache's stats in the Prometheus text format, labelled
+    with the worker's pid since each worker keeps its own cache."""
+    lines = []
+    for name, value in stats.items():
+        if name in ("hits", "shared_hits", "misses", "evictions"):
+            name = f"{name}_total"
+        lines.append(f'query_cache_{name}{{pid="{pid}"}} {value}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,102 @@
+import logging
+import os
+import sqlite3
+import threading
+
+from src.data_functions import decode_columns, sort_columns
+
+# the worksheet columns the filters read, by their name in SQL
+SQL_COLUMNS = {
+    "institution": "Institution",
+    "date": "Date",
+    "resource": "Resource",
+}
+
+
+def get_sql_values(column):
+    """Returns the column as a list of plain values, None where missing."""
+    values = column.astype(object)
+    return values.where(values.notna(), None).tolist()
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def placeholders(values):
+    return ", ".join("?" * len(values))
+
+
+class SqlBackend:
+    """Answers worksheet filters with an in-memory SQLite database holding the
+    columns they read. Each worksheet is loaded the first time it is queried.
+    Filtered rows are read back from the worksheet by position, so results are
+    the same as those of filter_df, which remains the reference
+    implementation."""
+
+    def __init__(self, get_sheet):
+        self._get_sheet = get_sheet
+        self._connection = None
+        self._pid = None
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # connections do not survive a fork, so each worker loads its own
+        if self._pid != os.getpid():
+            self._connection = sqlite3.connect(":memory:", check_same_thread=False)
+            self._tables = {}
+            self._pid = os.getpid()
+        return self._connection
+
+    def _load(self, sheet):
+        """Returns the SQL columns the worksheet has, copying them into a table
+        with one row per worksheet row first if needed."""
+        connection = self._connect()
+        if sheet not in self._tables:
+            df = self._get_sheet(sheet)
+            columns = [name for name, col in SQL_COLUMNS.items() if col in df.columns]
+            values = [get_sql_values(df[SQL_COLUMNS[name]]) for name in columns]
+            table = quote(sheet)
+            connection.execute(
+                f"CREATE TABLE {table} (row INTEGER PRIMARY KEY, {', '.join(columns)})"
+            )
+            connection.executemany(
+                f"INSERT INTO {table} VALUES (?, {placeholders(columns)})",
+                zip(range(len(df)), *values),
+            )
+            connection.execute(
+                f"CREATE INDEX {quote(sheet + '_date')} "
+                f"ON {table} (date, institution, row)"
+            )
+            logging.debug(f"Loaded {len(df)} rows of {sheet} into SQLite")
+            self._tables[sheet] = columns
+        return self._tables[sheet]
+
+    def _select(self, sheet, sql, institutions, date_range, machines):
+        """Runs sql on the worksheet's table, with {table} replaced by its name
+        and {filters} by the conditions rows must meet to pass the filters."""
+        with self._lock:
+            columns = self._load(sheet)
+            filters = (
+                f"institution IN ({placeholders(institutions)}) "
+                f"AND date IN ({placeholders(date_range)})"
+            )
+            params = [*institutions, *date_range]
+            if "resource" in columns:
+                filters += f" AND resource IN ({placeholders(machines)})"
+                params.extend(machines)
+            sql = sql.format(table=quote(sheet), filters=filters)
+            return self._connect().execute(sql, params).fetchall()
+
+    def filter_df(self, sheet, institutions, date_range, machines):
+        """Same result as filter_df on the worksheet."""
+        rows = self._select(
+            sheet,
+            "SELECT row FROM {table} WHERE {filters} ORDER BY date, institution, row",
+            list(institutions),
+            list(date_range),
+            list(machines),
+        )
+        df = self._get_sheet(sheet).take([row for (row,) in rows])
+        return decode_columns(sort_columns(df))
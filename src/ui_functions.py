@@ -1,13 +1,13 @@
 import copy
+import functools
+import plotly
 import plotly.express as px
-from dash import dash_table, dcc, html
-import plotly.graph_objects as go
-from src.data_functions import create_fy_options, get_all_months
+import plotly.io as pio
+from dash import Patch, dash_table, dcc, html, no_update
+from src.data_functions import create_fy_options, get_all_months, get_table_view
 from src.constants import MACHINES_MENU, INSTITUTIONS_MENU
 import json
 
-FY_OPTIONS = create_fy_options()
-
 FY_COLORS = [
     "#026",
     "#10f7a9",
@@ -16,6 +16,27 @@ FY_COLORS = [
     "#6039cc",
 ]
 
+# rows sent to the browser per data table page
+TABLE_PAGE_SIZE = 200
+
+# order of the institutions along the x axis of the bar graphs
+INSTITUTION_ORDER = [
+    "UTAus",
+    "UTA",
+    "UTD",
+    "UTEP",
+    "UTPB",
+    "UTRGV",
+    "UTSA",
+    "UTT",
+    "UTHSC-H",
+    "UTHSC-SA",
+    "UTMB",
+    "UTMDA",
+    "UTSW",
+    "UTSYS",
+]
+
 
 def make_date_dd(which):
     dates = get_all_months()
@@ -223,7 +244,7 @@ def make_filters(dd_label, dd_options, dd_default):
                                         className="filter-box__label",
                                     ),
                                     dcc.Dropdown(
-                                        FY_OPTIONS,
+                                        create_fy_options(),
                                         id="fy_dd",
                                     ),
                                 ],
@@ -405,7 +426,7 @@ def make_date_range(start_date=None, end_date=None, pos=0):
                                 className="filter-box__label",
                             ),
                             dcc.Dropdown(
-                                FY_OPTIONS,
+                                create_fy_options(),
                                 id={"type": "fy-dd", "index": pos},
                             ),
                         ],
@@ -566,65 +587,182 @@ def make_summary_panel(names, ids):
         )
 
 
-def make_data_table(df, sort_by=None):
-    styles = get_table_styles()
+def get_table_page(df, page_current=None):
+    """Returns the records on one page of a data table's rows, and the number
+    of pages."""
+    start = (page_current or 0) * TABLE_PAGE_SIZE
+    page_count = max(1, -(-len(df) // TABLE_PAGE_SIZE))
+    return df.iloc[start : start + TABLE_PAGE_SIZE].to_dict("records"), page_count
 
-    if sort_by is None:
-        table = dash_table.DataTable(
-            id="datatable_id",
-            data=df.to_dict("records"),
-            columns=[{"name": i, "id": i} for i in df.columns],
-            fixed_rows={"headers": True},
-            page_size=200,
-            style_header=styles["style_header"],
-            style_cell=styles["style_cell"],
-            style_data_conditional=styles["style_data_conditional"],
-            style_cell_conditional=create_conditional_style(df),
-            style_header_conditional=styles["style_header_conditional"],
-            sort_action="native",
-            filter_action="native",
-            style_as_list_view=True,
-        )
-    else:
-        table = dash_table.DataTable(
-            id="datatable_id",
-            data=df.to_dict("records"),
-            columns=[{"name": i, "id": i} for i in df.columns],
-            fixed_rows={"headers": True},
-            page_size=200,
-            style_header=styles["style_header"],
-            style_cell=styles["style_cell"],
-            style_data_conditional=styles["style_data_conditional"],
-            style_cell_conditional=create_conditional_style(df),
-            style_header_conditional=styles["style_header_conditional"],
-            sort_action="native",
-            sort_by=sort_by,
-            filter_action="native",
-            style_as_list_view=True,
-        )
+
+def make_data_table(df, sort_by=None, table_id="datatable_id"):
+    """Returns a table that shows the first page of df. The page's callback
+    serves the other pages, sorted and filtered as the table asks, so the
+    browser only ever holds one page."""
+    styles = get_table_styles()
+    sort_by = sort_by or []
+    data, page_count = get_table_page(get_table_view(df, sort_by))
+
+    table = dash_table.DataTable(
+        id=table_id,
+        data=data,
+        columns=[{"name": i, "id": i} for i in df.columns],
+        fixed_rows={"headers": True},
+        page_action="custom",
+        page_current=0,
+        page_size=TABLE_PAGE_SIZE,
+        page_count=page_count,
+        style_header=styles["style_header"],
+        style_cell=styles["style_cell"],
+        style_data_conditional=styles["style_data_conditional"],
+        style_cell_conditional=create_conditional_style(df),
+        style_header_conditional=styles["style_header_conditional"],
+        sort_action="custom",
+        sort_by=sort_by,
+        filter_action="custom",
+        filter_query="",
+        style_as_list_view=True,
+    )
     return table
 
 
-def make_bar_graph(df, title, dates, yaxis, ytitle=None, hover=None):
-    colors = make_color_map(dates)
-    category_orders = {
-        "Institution": [
-            "UTAus",
-            "UTA",
-            "UTD",
-            "UTEP",
-            "UTPB",
-            "UTRGV",
-            "UTSA",
-            "UTT",
-            "UTHSC-H",
-            "UTHSC-SA",
-            "UTMB",
-            "UTMDA",
-            "UTSW",
-            "UTSYS",
-        ]
+@functools.lru_cache(maxsize=None)
+def get_template():
+    """Returns the default plotly template as plain JSON. It is built once and
+    shared by every figure, so it must not be modified."""
+    template = pio.templates[pio.templates.default]
+    return json.loads(json.dumps(template, cls=plotly.utils.PlotlyJSONEncoder))
+
+
+@functools.lru_cache(maxsize=None)
+def get_bar_layout():
+    """Returns the layout px.bar gives the institution bar graphs, without the
+    y axis title. Shared like get_template."""
+    return {
+        "template": get_template(),
+        "xaxis": {
+            "anchor": "y",
+            "domain": [0.0, 1.0],
+            "title": {"text": "Institution"},
+            "categoryorder": "array",
+            "categoryarray": INSTITUTION_ORDER,
+        },
+        "yaxis": {"anchor": "x", "domain": [0.0, 1.0]},
+        "legend": {"title": {"text": "Date"}, "tracegroupgap": 0},
+        "margin": {"t": 60},
+        "barmode": "group",
+    }
+
+
+def make_bar_figure(df, yaxis, colors, ytitle=None, hover=None):
+    """Returns the figure px.bar draws for rows that are already aggregated
+    per institution and date, as a plain dict. There is one trace per date in
+    order of appearance, and dates without a color take the next template
+    color as in plotly express."""
+    colorway = get_template()["layout"]["colorway"]
+    colors = dict(colors)
+    data = []
+    for date, rows in df.groupby("Date", sort=False, observed=True):
+        if date not in colors:
+            colors[date] = colorway[len(colors) % len(colorway)]
+        hovertemplate = f"Date={date}<br>Institution=%{{x}}<br>{yaxis}=%{{y}}"
+        trace = {
+            "alignmentgroup": "True",
+            "legendgroup": str(date),
+            "marker": {"color": colors[date], "pattern": {"shape": ""}},
+            "name": str(date),
+            "offsetgroup": str(date),
+            "orientation": "v",
+            "showlegend": True,
+            "textposition": "auto",
+            "texttemplate": "%{y}",
+            "x": rows["Institution"].tolist(),
+            "xaxis": "x",
+            "y": rows[yaxis].tolist(),
+            "yaxis": "y",
+            "type": "bar",
+        }
+        if hover:
+            trace["customdata"] = [[value] for value in rows[hover].tolist()]
+            hovertemplate += f"<br>{hover}=%{{customdata[0]}}"
+        trace["hovertemplate"] = hovertemplate + "<extra></extra>"
+        data.append(trace)
+    layout = dict(get_bar_layout())
+    layout["yaxis"] = {**layout["yaxis"], "title": {"text": ytitle or yaxis}}
+    return {"data": data, "layout": layout}
+
+
+def patch_figure(patch, old, new):
+    """Adds the operations that turn figure dict old into new to patch, which
+    points at the figure, and returns their number. Traces are matched by name
+    and only their changed properties are sent. Returns None when the traces
+    they share are in a different order, so the figure must be replaced."""
+    old_names = [trace["name"] for trace in old["data"]]
+    new_names = [trace["name"] for trace in new["data"]]
+    if [name for name in old_names if name in new_names] != [
+        name for name in new_names if name in old_names
+    ]:
+        return None
+    changes = 0
+    for i in reversed(range(len(old_names))):
+        if old_names[i] not in new_names:
+            del patch["data"][i]
+            changes += 1
+    shown = {trace["name"]: trace for trace in old["data"]}
+    for i, trace in enumerate(new["data"]):
+        if trace["name"] not in shown:
+            patch["data"].insert(i, trace)
+            changes += 1
+            continue
+        changes += patch_dict(patch["data"][i], shown[trace["name"]], trace)
+    return changes + patch_dict(patch["layout"], old["layout"], new["layout"])
+
+
+def patch_dict(patch, old, new):
+    changes = 0
+    for key in old.keys() - new.keys():
+        del patch[key]
+        changes += 1
+    for key, value in new.items():
+        if key not in old or old[key] != value:
+            patch[key] = value
+            changes += 1
+    return changes
+
+
+def selects_all(*values):
+    """Returns True when a dropdown value holds "All", which the select all
+    callback in app.py is about to replace with every option."""
+    return any(value and "All" in value for value in values)
+
+
+def make_shown_filters(fingerprint, sheet, institutions, dates, machines):
+    """Returns what a page keeps in its dcc.Store about the filters its graphs
+    were drawn with, so the next update can patch them."""
+    return {
+        "fingerprint": fingerprint,
+        "sheet": sheet,
+        "institutions": institutions,
+        "dates": dates,
+        "machines": machines,
     }
+
+
+def get_shown_filters(shown, fingerprint, sheet):
+    """Returns the filters kept by make_shown_filters if the graphs on the page
+    can be patched, or None when they must be drawn in full: on the first
+    update, after the dataset was reloaded or when another worksheet was
+    picked."""
+    if not shown or shown["fingerprint"] != fingerprint or shown["sheet"] != sheet:
+        return None
+    return shown
+
+
+def make_bar_graph(df, title, dates, yaxis, ytitle=None, hover=None, previous=None):
+    """Returns a graph card with a bar graph of df. When previous holds the rows
+    and dates the card on the page was drawn from, returns a Patch that only
+    changes what differs, or no_update when nothing does."""
+    colors = make_color_map(dates)
     if not yaxis:
         fig = px.histogram(
             data_frame=df,
@@ -633,62 +771,57 @@ def make_bar_graph(df, title, dates, yaxis, ytitle=None, hover=None):
             barmode="group",
             color_discrete_map=colors,
             text_auto=True,
-            category_orders=category_orders,
+            category_orders={"Institution": INSTITUTION_ORDER},
         )
+        if ytitle:
+            fig.update_layout(yaxis_title=ytitle)
     else:
-        fig = px.bar(
-            data_frame=df,
-            x="Institution",
-            y=yaxis,
-            color="Date",
-            barmode="group",
-            color_discrete_map=colors,
-            text_auto=True,
-            hover_data=[hover],
-            category_orders=category_orders,
-        )
-    if ytitle:
-        fig.update_layout(yaxis_title=ytitle)
+        fig = make_bar_figure(df, yaxis, colors, ytitle, hover)
+        if previous is not None:
+            shown = make_bar_figure(
+                previous[0], yaxis, make_color_map(previous[1]), ytitle, hover
+            )
+            patch = Patch()
+            figure = patch["props"]["children"][1]["props"]["figure"]
+            changes = patch_figure(figure, shown, fig)
+            if changes == 0:
+                return no_update
+            if changes is not None:
+                return patch
     return html.Div(
         [html.H2(title), dcc.Graph(figure=fig)],
         className="graph-card",
     )
 
 
-def add_hist_trace(fig, df, name, i):
-    # add a trace to the comparison bar graph
-    fig.add_trace(
-        go.Histogram(
-            x=df["Month Name"].to_list(),
-            name=name,
-            marker={"color": FY_COLORS[i % 4]},
-        )
-    )
-    return fig
-
-
-def add_bar_trace(fig, df, name, i, yaxis):
-    # add a trace to the comparison bar graph
-    fig.add_trace(
-        go.Bar(
-            x=df["Month Name"].to_list(),
-            y=df[yaxis].to_list(),
-            name=name,
-            marker={"color": FY_COLORS[i % 4]},
-        )
-    )
-    return fig
-
-
 def make_bar_graph_comparison(dfs, names, xaxis, yaxis=None, chart_type="Hist"):
-    fig = go.Figure()
-
+    """Returns a figure that overlays one bar trace per date range. Hist charts
+    count the rows per month, without gaps between the bars as in a
+    histogram."""
+    data = []
     for idx, (df, name) in enumerate(zip(dfs, names)):
         if chart_type == "Hist":
-            fig = add_hist_trace(fig, df, name, idx)
-        elif chart_type == "Bar":
-            fig = add_bar_trace(fig, df, name, idx, yaxis)
-
-    fig.update_layout(barmode="overlay", xaxis_title_text=xaxis, yaxis_title_text=yaxis)
-    fig.update_traces(opacity=0.75)
-    return fig
+            counts = df.groupby("Month Name", sort=False).size()
+            x, y = counts.index.tolist(), counts.tolist()
+        else:
+            x, y = df["Month Name"].tolist(), df[yaxis].tolist()
+        data.append(
+            {
+                "type": "bar",
+                "x": x,
+                "y": y,
+                "name": name,
+                "marker": {"color": FY_COLORS[idx % 4]},
+                "opacity": 0.75,
+            }
+        )
+    layout = {
+        "template": get_template(),
+        "barmode": "overlay",
+        "xaxis": {"title": {"text": xaxis}},
+    }
+    if yaxis:
+        layout["yaxis"] = {"title": {"text": yaxis}}
+    if chart_type == "Hist":
+        layout["bargap"] = 0
+    return {"data": data, "layout": layout}
@@ -0,0 +1,40 @@
+import os
+
+import pandas as pd
+import pytest
+
+WORKSHEETS = ["utrc_individual_user_hpc_usage", "utrc_corral_usage"]
+
+
+def write_report(
+    reports_path, start, end, logins, institution="University of Texas at Austin"
+):
+    users = pd.DataFrame(
+        {
+            "root_institution_name": [institution] * len(logins),
+            "login": logins,
+            "resource_name": ["Lonestar6"] * len(logins),
+            "sus_charged": [1.5 * i for i in range(len(logins))],
+        }
+    )
+    corral = pd.DataFrame(
+        {
+            "root_institution_name": ["University of Texas at Dallas"],
+            "storage_granted": [2048],
+            "storage_unit": ["GB"],
+        }
+    )
+    path = os.path.join(reports_path, f"utrc_report_{start}_to_{end}.xlsx")
+    with pd.ExcelWriter(path) as writer:
+        users.to_excel(writer, sheet_name=WORKSHEETS[0], index=False)
+        corral.to_excel(writer, sheet_name=WORKSHEETS[1], index=False)
+    return path
+
+
+@pytest.fixture
+def reports_path(tmp_path):
+    path = tmp_path / "monthly_reports"
+    path.mkdir()
+    write_report(path, "2023-01-01", "2023-02-01", ["a", "b"])
+    write_report(path, "2023-02-01", "2023-03-01", ["a", "b", "c"])
+    return str(path)
@@ -1,17 +1,34 @@
+import numpy as np
 import pandas as pd
+import pytest
 
+import src.data_functions
 from src.data_functions import (
+    calc_corral_monthly_sums,
     calc_corral_monthly_sums_with_peaks,
     calc_corral_total,
+    clean_df,
     calc_monthly_avgs,
     calc_node_monthly_sums,
     calc_node_monthly_sums_no_machine,
     create_fy_options,
+    filter_df,
+    filter_sorted_df,
     get_allocation_totals,
     get_date_list,
+    get_table_view,
     get_totals,
+    materialize_worksheet,
+    merge_workbooks,
+    normalize_storage_granted,
+    parse_filter_query,
+    read_workbook,
     select_df,
+    share_categories,
+    sort_worksheet,
+    store_text_in_arrow,
 )
+from tests.conftest import WORKSHEETS, write_report
 
 
 # General purpose functions
@@ -21,6 +38,126 @@ def test_create_fy_options():
     assert t1 == ["22-23", "23-24", "24-25", "25-26"]
 
 
+def test_merge_workbooks(reports_path):
+    r1 = merge_workbooks(WORKSHEETS, reports_path, workers=1)
+    assert r1["utrc_individual_user_hpc_usage"]["Date"].tolist() == [
+        "23-01",
+        "23-01",
+        "23-02",
+        "23-02",
+        "23-02",
+    ]
+
+    # parsing in a process pool produces the same result as parsing serially
+    t1 = merge_workbooks(WORKSHEETS, reports_path, workers=2)
+    for sheet in WORKSHEETS:
+        pd.testing.assert_frame_equal(t1[sheet], r1[sheet])
+
+
+def test_materialize_worksheet():
+    d1 = {"Institution": ["UTAus", "UTA"], "SU's Charged": [1, "n/a"], "Date": "23-01"}
+    d2 = {"Institution": ["UTD"], "SU's Charged": [2.5], "Date": "23-02"}
+    frames = [pd.DataFrame(d1), pd.DataFrame(columns=["sus_charged"]), pd.DataFrame(d2)]
+    t1 = materialize_worksheet(frames)
+    assert t1["Institution"].tolist() == ["UTAus", "UTA", "UTD"]
+    assert t1["SU's Charged"].dtype == "float64"
+    assert t1["SU's Charged"].tolist()[::2] == [1.0, 2.5]
+    assert t1["SU's Charged"].isna().tolist() == [False, True, False]
+    assert t1.index.tolist() == [0, 1, 0]
+
+
+def test_clean_df(monkeypatch):
+    matched = []
+    fuzzy_match_institution = src.data_functions.fuzzy_match_institution
+
+    def record_match(institution_input):
+        matched.append(institution_input)
+        return fuzzy_match_institution(institution_input)
+
+    monkeypatch.setattr(src.data_functions, "fuzzy_match_institution", record_match)
+    monkeypatch.setattr(src.data_functions, "INSTITUTION_ALIASES", {})
+    d1 = {
+        "root_institution_name": [
+            "University of Texas at Austin",
+            "Univ of Texas at Dalas",
+            None,
+            "Univ of Texas at Dalas",
+        ],
+        "login": ["a", "b", "c", "d"],
+        "Unnamed: 2": [None, None, None, None],
+    }
+    df1 = pd.DataFrame(data=d1)
+    clean_df(df1)
+    r1 = pd.DataFrame(
+        data={"Institution": ["UTAus", "UTD", "UTD"], "Login": ["a", "b", "d"]}
+    )
+    assert df1.equals(r1)
+
+    # each unknown spelling is fuzzy matched once and then remembered
+    assert matched == ["Univ of Texas at Dalas"]
+    clean_df(pd.DataFrame(data=d1))
+    assert matched == ["Univ of Texas at Dalas"]
+
+
+def test_merge_workbooks_seeds_aliases(tmp_path, monkeypatch):
+    reports_path = str(tmp_path)
+    for start, end in [("2023-01-01", "2023-02-01"), ("2023-02-01", "2023-03-01")]:
+        write_report(reports_path, start, end, ["a"], "Univ of Texas at Austn")
+    # a known alias is used in the pool processes instead of a fuzzy match,
+    # which would resolve this spelling to UTAus
+    monkeypatch.setattr(
+        src.data_functions, "INSTITUTION_ALIASES", {"Univ of Texas at Austn": "UTD"}
+    )
+    t1 = merge_workbooks(WORKSHEETS, reports_path, workers=2)
+    assert t1[WORKSHEETS[0]]["Institution"].tolist() == ["UTD", "UTD"]
+
+
+def test_normalize_storage_granted():
+    d1 = {
+        "Institution": ["UTAus", "UTA", "UTD", "UTEP", "UTSA"],
+        "Storage Granted": [2048, 5, 2, 10, 1],
+        "Storage Unit": ["GB", "TB", "pb ", "EB", None],
+    }
+    t1 = normalize_storage_granted(pd.DataFrame(data=d1))
+    r1 = [2.0, 5.0, 2048.0]
+    assert t1["Storage Granted (TB)"].tolist()[:3] == r1
+    assert t1["Storage Granted (TB)"].isna().tolist() == [False] * 3 + [True] * 2
+    assert t1["Unknown Storage Unit?"].tolist() == [None, None, None, "X", "X"]
+
+    # older reports only have storage in GB
+    d2 = {"Institution": ["UTAus"], "Storage Granted (Gb)": [512]}
+    t2 = normalize_storage_granted(pd.DataFrame(data=d2))
+    assert t2["Storage Granted (TB)"].tolist() == [0.5]
+    assert "Unknown Storage Unit?" not in t2.columns
+
+
+@pytest.mark.parametrize("engine", ["openpyxl", "calamine"])
+def test_read_workbook(tmp_path, engine):
+    if engine == "calamine":
+        pytest.importorskip("python_calamine")
+    d1 = {
+        "root_institution_name": ["University of Texas at Austin", "UTA"],
+        "resource_name": ["Lonestar6", "Frontera"],
+        "sus_charged": [10, 20],
+        "internal_notes": ["not", "shown"],
+    }
+    path = tmp_path / "utrc_report_2023-01-01_to_2023-02-01.xlsx"
+    pd.DataFrame(data=d1).to_excel(
+        path, sheet_name="utrc_active_allocations", index=False
+    )
+    t1 = read_workbook(str(path), ["utrc_active_allocations"], engine)
+    df = t1["utrc_active_allocations"]
+    assert df.columns.tolist() == [
+        "root_institution_name",
+        "resource_name",
+        "sus_charged",
+    ]
+    assert df["root_institution_name"].dtype == "category"
+    assert df["resource_name"].dtype == "category"
+    assert df["sus_charged"].tolist() == [10.0, 20.0]
+    assert df["sus_charged"].dtype == "float64"
+
+
 def test_get_date_list():
     # This may break if spreadsheet data changes
     r1 = ["23-11", "23-12"]
@@ -155,6 +292,49 @@ def test_select_df():
     assert t2.equals(r2)
 
 
+def test_share_categories():
+    d1 = {
+        "Institution": ["UTAus", "UTD", "UTAus", "UTSW", "UTAus"],
+        "Resource": ["Lonestar6", "Frontera", "Lonestar6", "Lonestar6", "Vista"],
+        "SU's Charged": [1.0, 2.0, 3.0, 4.0, 5.0],
+        "Date": ["23-01", "23-01", "23-02", "23-02", "23-03"],
+    }
+    d2 = {"Institution": ["UTA"], "Date": ["23-04"]}
+    df1 = pd.DataFrame(data=d1)
+    t1 = share_categories(
+        {
+            "sheet1": materialize_worksheet([df1.copy()]),
+            "sheet2": materialize_worksheet([pd.DataFrame(data=d2)]),
+        }
+    )
+    for col in ["Institution", "Date"]:
+        assert t1["sheet1"][col].dtype == t1["sheet2"][col].dtype
+    r1 = ["UTA", "UTAus", "UTD", "UTSW"]
+    assert t1["sheet2"]["Institution"].cat.categories.tolist() == r1
+
+    # filtering on category codes returns the same rows as filtering strings
+    args = (["UTAus", "UTSW", "UTEP"], ["23-02", "23-03"], ["Lonestar6", "Vista"])
+    assert filter_df(t1["sheet1"], *args).equals(filter_df(df1, *args))
+
+
+def test_store_text_in_arrow():
+    d1 = {
+        "Institution": ["UTAus", "UTD"],
+        "Login": ["uname", None],
+        "Account ID": [1, "a2"],
+        "Date": ["23-01", "23-01"],
+    }
+    t1 = store_text_in_arrow(pd.DataFrame(data=d1))
+    assert t1["Login"].dtype == "string"
+    assert t1["Account ID"].dtype == object
+
+    # filtered frames hold plain values again
+    t2 = filter_df(t1, ["UTAus", "UTD"], ["23-01"], ["Lonestar6"])
+    assert t2["Login"].dtype == object
+    assert t2["Login"].tolist()[0] == "uname"
+    assert pd.isna(t2["Login"].tolist()[1])
+
+
 # Functions that are used in allocations.py
 def test_calc_monthly_avgs():
     # df for t1
@@ -614,3 +794,207 @@ def test_calc_node_monthly_sums_no_machine():
     r1 = pd.DataFrame(data=d2)
     t1 = calc_node_monthly_sums_no_machine(df1, "UTAus")
     assert t1.equals(r1)
+
+
+# summed in row order these come to 5958.500000000001, groupby's compensated
+# sum gives 5958.5 which rounds down
+HALF_SUM = [81.46, 589.94, 965.87, 310.57, 173.73, 604.12]
+HALF_SUM += [569.92, 577.26, 441.48, 660.18, 932.02, 51.95]
+
+
+# the nested get_group loops the chart functions replaced, kept as references
+def calc_monthly_avgs_by_group(df, institutions):
+    # calc_monthly_avgs before it was a single groupby
+    inst_grps = df.groupby(["Institution"])
+    df_with_avgs = {"Institution": [], "Date": [], "Resource": [], "Count": []}
+    for inst in institutions:
+        try:
+            monthly_avg = inst_grps.get_group((inst,))["Date"].value_counts().mean()
+            df_with_avgs["Institution"].append(inst)
+            df_with_avgs["Date"].append("AVG")
+            df_with_avgs["Count"].append(round(monthly_avg))
+            df_with_avgs["Resource"].append("ALL")
+            date_grps = inst_grps.get_group((inst,)).groupby(["Date"])
+            for date in date_grps.groups.keys():
+                machine_grps = date_grps.get_group((date,)).groupby(["Resource"])
+                for machine in machine_grps.groups:
+                    current_count = machine_grps.get_group((machine,)).shape[0]
+                    df_with_avgs["Institution"].append(inst)
+                    df_with_avgs["Resource"].append(machine)
+                    df_with_avgs["Count"].append(round(current_count))
+                    df_with_avgs["Date"].append(date)
+        except KeyError:
+            continue
+    df_with_avgs = pd.DataFrame(df_with_avgs)
+    df_with_avgs.sort_values(["Date", "Institution"], inplace=True)
+    return df_with_avgs
+
+
+def calc_corral_monthly_sums_by_group(df, institutions):
+    # calc_corral_monthly_sums before it was a single groupby
+    inst_grps = df.groupby(["Institution"])
+    dict_with_avgs = {"Institution": [], "Date": [], "Storage Granted (TB)": []}
+    for inst in institutions:
+        try:
+            date_grps = inst_grps.get_group((inst,)).groupby(["Date"])
+            for date in date_grps.groups.keys():
+                monthly_sum = date_grps.get_group((date,))["Storage Granted (TB)"].sum()
+                dict_with_avgs["Institution"].append(inst)
+                dict_with_avgs["Storage Granted (TB)"].append(round(monthly_sum))
+                dict_with_avgs["Date"].append(date)
+        except KeyError:
+            continue
+    df_with_avgs = pd.DataFrame(dict_with_avgs)
+    df_with_avgs.sort_values(["Date", "Institution"], inplace=True)
+    return df_with_avgs
+
+
+def calc_node_monthly_sums_by_group(df, institutions):
+    # calc_node_monthly_sums before it was a single groupby
+    inst_grps = df.groupby(["Institution"])
+    dict_with_avgs = {"Institution": [], "Resource": [], "Date": [], "SU's Charged": []}
+    for inst in institutions:
+        try:
+            date_grps = inst_grps.get_group((inst,)).groupby(["Date"])
+            for date in date_grps.groups.keys():
+                machine_grps = date_grps.get_group((date,)).groupby(["Resource"])
+                for machine in machine_grps.groups:
+                    monthly_sum = machine_grps.get_group((machine,))[
+                        "SU's Charged"
+                    ].sum()
+                    dict_with_avgs["Institution"].append(inst)
+                    dict_with_avgs["Resource"].append(machine)
+                    dict_with_avgs["SU's Charged"].append(round(monthly_sum))
+                    dict_with_avgs["Date"].append(date)
+        except KeyError:
+            continue
+    df_with_avgs = pd.DataFrame(dict_with_avgs)
+    df_with_avgs.sort_values(["Date", "Institution"], inplace=True)
+    return df_with_avgs
+
+
+def make_usage_sheet(rows, seed):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        {
+            "Institution": rng.choice(["UTAus", "UTA", "UTD", "UTEP"], rows),
+            "Resource": rng.choice(["Lonestar6", "Frontera", None], rows),
+            "SU's Charged": rng.gamma(2.0, 500.0, rows).round(2),
+            "Storage Granted (TB)": rng.integers(0, 2048, rows) / 1024,
+            "Date": rng.choice(["23-01", "23-02", "23-03", None], rows),
+        }
+    )
+    half = pd.DataFrame(
+        {
+            "Institution": "UTA",
+            "Resource": "Lonestar6",
+            "SU's Charged": HALF_SUM,
+            "Storage Granted (TB)": HALF_SUM,
+            "Date": "23-04",
+        }
+    )
+    return pd.concat([df, half], ignore_index=True)
+
+
+@pytest.mark.parametrize(
+    "institutions",
+    [["UTAus", "UTA", "UTD", "UTEP"], ["UTD", "UTSW", "UTAus"], ["UTA", "UTA"], []],
+)
+def test_monthly_charts_match_group_loops(institutions):
+    df = make_usage_sheet(5000, 0)
+    pd.testing.assert_frame_equal(
+        calc_monthly_avgs(df, institutions),
+        calc_monthly_avgs_by_group(df, institutions),
+    )
+    pd.testing.assert_frame_equal(
+        calc_monthly_avgs(df.drop(columns="Resource"), institutions),
+        calc_monthly_avgs_by_group(df.drop(columns="Resource"), institutions),
+    )
+    pd.testing.assert_frame_equal(
+        calc_node_monthly_sums(df, institutions),
+        calc_node_monthly_sums_by_group(df, institutions),
+    )
+    pd.testing.assert_frame_equal(
+        calc_corral_monthly_sums(df, institutions),
+        calc_corral_monthly_sums_by_group(df, institutions),
+    )
+
+
+@pytest.mark.parametrize(
+    "institutions,date_range,machines",
+    [
+        (["UTAus", "UTA", "UTD", "UTEP"], ["23-01", "23-02", "23-03"], ["Frontera"]),
+        (["UTD", "UTSW", "UTD"], ["23-03", "23-01"], ["Lonestar6", "Frontera"]),
+        (["UTA"], ["24-01"], ["Lonestar6"]),
+        ([], ["23-01"], ["Lonestar6"]),
+    ],
+)
+def test_filter_sorted_df(institutions, date_range, machines):
+    df = make_usage_sheet(2000, 1)
+    # monthly frames are concatenated without renumbering their rows
+    df.index = df.index % 500
+    for col in ["Institution", "Resource", "Date"]:
+        df[col] = df[col].astype("category")
+    sorted_df, keys = sort_worksheet(df)
+    assert (np.diff(keys) >= 0).all()
+    assert sort_worksheet(sorted_df)[0] is sorted_df
+
+    pd.testing.assert_frame_equal(
+        filter_sorted_df(sorted_df, keys, institutions, date_range, machines),
+        filter_df(df, institutions, date_range, machines),
+    )
+    no_machines = sorted_df.drop(columns="Resource")
+    pd.testing.assert_frame_equal(
+        filter_sorted_df(no_machines, keys, institutions, date_range, machines),
+        filter_df(df.drop(columns="Resource"), institutions, date_range, machines),
+    )
+
+
+def test_parse_filter_query():
+    t1 = parse_filter_query(
+        '{Institution} icontains "u\\"t" && {SU\'s Charged} >= 100 && '
+        "{Login} is blank && Login = a && {Date} datestartswith 23"
+    )
+    assert t1 == [
+        ("Institution", "icontains", 'u"t'),
+        ("SU's Charged", "ge", "100"),
+        ("Login", "is blank", None),
+        ("Date", "datestartswith", "23"),
+    ]
+    assert parse_filter_query("") == []
+    # the filter row sends case prefixed symbols
+    t2 = parse_filter_query(
+        "{SU's Charged} s> 100 && {Institution} s= UTAus && {Login} i!= x && "
+        '{Login} scontains "a && b"'
+    )
+    assert t2 == [
+        ("SU's Charged", "sgt", "100"),
+        ("Institution", "seq", "UTAus"),
+        ("Login", "ine", "x"),
+        ("Login", "scontains", "a && b"),
+    ]
+
+
+def test_get_table_view():
+    df = pd.DataFrame(
+        {
+            "Institution": ["UTA", "UTD", "TTU", None],
+            "SU's Charged": [50.0, 150.0, 300.0, None],
+            "Login": ["a", "", None, "d"],
+        }
+    )
+    t1 = get_table_view(df, filter_query='{Institution} icontains "ut"')
+    assert t1["Institution"].tolist() == ["UTA", "UTD"]
+    t2 = get_table_view(df, filter_query="{SU's Charged} > 100 && {Login} is blank")
+    assert t2["Institution"].tolist() == ["UTD", "TTU"]
+    # numbers are compared as numbers, not as text
+    t3 = get_table_view(df, filter_query="{SU's Charged} < 100.5")
+    assert t3["Institution"].tolist() == ["UTA"]
+    t5 = get_table_view(df, filter_query="{SU's Charged} s> 100 && {Login} i= ''")
+    assert t5["Institution"].tolist() == ["UTD"]
+    t6 = get_table_view(df, filter_query="{Institution} i= uta")
+    assert t6["Institution"].tolist() == ["UTA"]
+    t7 = get_table_view(df, filter_query="{Institution} s= uta")
+    assert t7["Institution"].tolist() == []
+    t4 = get_table_view(df, [{"column_id": "SU's Charged", "direction": "desc"}])
+    assert t4["Institution"].tolist() == ["TTU", "UTD", "UTA", None]
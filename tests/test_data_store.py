@@ -0,0 +1,186 @@
+import os
+
+import pandas as pd
+
+from src.data_store import DataStore
+from src.dataset_cache import ingest_workbooks, write_artifact
+from src.metric_cube import calc_cube_monthly_avgs
+from tests.conftest import WORKSHEETS, write_report
+
+
+def test_get_sheet(reports_path, tmp_path):
+    store = DataStore(WORKSHEETS, str(tmp_path / "cache"), reports_path)
+    dataset = store.snapshot()
+    assert dataset.loaded_sheets() == []
+
+    # worksheets are read on first access and then reused
+    df = store.get_sheet("utrc_corral_usage")
+    assert dataset.loaded_sheets() == ["utrc_corral_usage"]
+    assert store.get_sheet("utrc_corral_usage") is df
+
+    # every worksheet is coded against the categories of all reports
+    users = dataset["utrc_individual_user_hpc_usage"]
+    for col in ["Institution", "Date"]:
+        assert df[col].dtype == users[col].dtype
+
+
+def test_get_cube(reports_path, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    store = DataStore(WORKSHEETS, cache_dir, reports_path)
+    # without an artifact the cube is built from the worksheet's rows
+    t1 = store.get_cube(WORKSHEETS[0])
+    assert store.snapshot().loaded_sheets() == [WORKSHEETS[0]]
+    assert t1["Count"].tolist() == [2, 3]
+
+    # with one it is read without touching the rows
+    write_artifact(cache_dir, ingest_workbooks(WORKSHEETS, cache_dir, reports_path))
+    store = DataStore(WORKSHEETS, cache_dir, reports_path)
+    t2 = store.get_cube(WORKSHEETS[0])
+    assert store.snapshot().loaded_sheets() == []
+    pd.testing.assert_frame_equal(t1, t2)
+
+
+def test_get_tensor(reports_path, tmp_path):
+    store = DataStore(WORKSHEETS, str(tmp_path / "cache"), reports_path)
+    tensor = store.get_tensor(WORKSHEETS[0])
+    assert store.snapshot().loaded_tensors() == [WORKSHEETS[0]]
+    assert store.get_tensor(WORKSHEETS[0]) is tensor
+    args = (["UTAus"], ["23-01", "23-02"], ["Lonestar6"])
+    df = calc_cube_monthly_avgs(tensor, *args)
+    assert df["Count"].tolist() == [2, 3, 2]
+
+
+def test_query(reports_path, tmp_path):
+    store = DataStore(WORKSHEETS, str(tmp_path / "cache"), reports_path)
+    df = store.query(
+        "utrc_individual_user_hpc_usage", ["UTAus"], ["23-02"], ["Lonestar6"]
+    )
+    assert df["Login"].tolist() == ["a", "b", "c"]
+    assert df["Institution"].dtype == object
+
+
+def test_table_view(reports_path, tmp_path):
+    store = DataStore(
+        WORKSHEETS, str(tmp_path / "cache"), reports_path, query_cache_mb=1
+    )
+    args = ("utrc_individual_user_hpc_usage", ["UTAus"], ["23-02"], ["Lonestar6"])
+    sort_by = [{"column_id": "Login", "direction": "desc"}]
+    df = store.snapshot().table_view(*args, sort_by, "{Login} != a")
+    assert df["Login"].tolist() == ["c", "b"]
+    # paging through the view reuses it
+    assert store.snapshot().table_view(*args, sort_by, "{Login} != a") is df
+
+
+def test_rows_view(reports_path, tmp_path):
+    store = DataStore(
+        WORKSHEETS, str(tmp_path / "cache"), reports_path, query_cache_mb=1
+    )
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return pd.DataFrame({"Login": ["a", "c", "b"]})
+
+    dataset = store.snapshot()
+    t1 = dataset.rows_view(("rows",), compute, None, "{Login} s!= a")
+    t2 = dataset.rows_view(
+        ("rows",), compute, [{"column_id": "Login", "direction": "asc"}], None
+    )
+    assert t1["Login"].tolist() == ["c", "b"]
+    assert t2["Login"].tolist() == ["a", "b", "c"]
+    # sorting and filtering again reuse the computed rows
+    assert len(calls) == 1
+
+
+def test_query_sqlite(reports_path, tmp_path):
+    stores = [
+        DataStore(WORKSHEETS, str(tmp_path / "cache"), reports_path, backend=backend)
+        for backend in ["pandas", "sqlite"]
+    ]
+    args = ("utrc_individual_user_hpc_usage", ["UTAus"], ["23-01", "23-02"])
+    pd.testing.assert_frame_equal(
+        stores[1].query(*args, ["Lonestar6"]), stores[0].query(*args, ["Lonestar6"])
+    )
+
+
+def test_query_cache(reports_path, tmp_path):
+    store = DataStore(
+        WORKSHEETS, str(tmp_path / "cache"), reports_path, query_cache_mb=1
+    )
+    args = ("utrc_individual_user_hpc_usage", ["UTAus"], ["23-02", "23-01"])
+    df = store.query(*args, ["Lonestar6"])
+    # the same selection in another order is served from the cache
+    assert store.query(*args[:2], ["23-01", "23-02"], ["Lonestar6"]) is df
+    assert store.query_cache.stats()["hits"] == 1
+
+    # results of an older version are not served after a reload
+    write_report(reports_path, "2023-03-01", "2023-04-01", ["d"])
+    assert store.reload() is True
+    assert store.query_cache.stats()["entries"] == 0
+    assert store.query(*args, ["Lonestar6"]) is not df
+
+
+def test_shared_query_cache(reports_path, tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    stores = [
+        DataStore(
+            WORKSHEETS,
+            str(tmp_path / "cache"),
+            reports_path,
+            query_cache_mb=1,
+            shared_cache_path=path,
+            shared_cache_mb=1,
+        )
+        for _ in range(2)
+    ]
+    args = ("utrc_individual_user_hpc_usage", ["UTAus"], ["23-01"], ["Lonestar6"])
+    df = stores[0].query(*args)
+    # workers that opened the same reports share their results
+    pd.testing.assert_frame_equal(stores[1].query(*args), df)
+    assert stores[1].query_cache.stats()["shared_hits"] == 1
+
+
+def test_reload(reports_path, tmp_path):
+    store = DataStore(WORKSHEETS, str(tmp_path / "cache"), reports_path)
+    t1 = store.snapshot()
+    t1.get_sheet(WORKSHEETS[0])
+    assert store.version == 1
+
+    # nothing changed, so the current version is kept
+    path = os.path.join(reports_path, "utrc_report_2023-01-01_to_2023-02-01.xlsx")
+    os.utime(path, ns=(0, 0))
+    assert store.reload() is False
+    assert store.snapshot() is t1
+
+    # a new report is swapped in as a new version and the old one is untouched
+    write_report(reports_path, "2023-03-01", "2023-04-01", ["d"])
+    assert store.reload() is True
+    t2 = store.snapshot()
+    assert store.version == 2
+    assert t2.loaded_sheets() == [WORKSHEETS[0]]
+    assert t1[WORKSHEETS[0]].shape[0] == 5
+    assert t2[WORKSHEETS[0]].shape[0] == 6
+
+
+def test_reload_without_ingest(reports_path, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    store = DataStore(WORKSHEETS, cache_dir, reports_path)
+    store.snapshot()
+    write_report(reports_path, "2023-03-01", "2023-04-01", ["d"])
+    # the new reports are only opened once their artifact is built
+    assert store.reload(ingest=False) is False
+    write_artifact(cache_dir, ingest_workbooks(WORKSHEETS, cache_dir, reports_path, 1))
+    assert store.reload(ingest=False) is True
+    assert store.get_sheet(WORKSHEETS[0]).shape[0] == 6
+
+
+def test_fallback_to_parsing(reports_path, tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache_dir.write_text("not a directory")
+    store = DataStore(WORKSHEETS, str(cache_dir), reports_path)
+    pd.testing.assert_index_equal(
+        store.get_sheet("utrc_corral_usage").columns,
+        DataStore(WORKSHEETS, str(tmp_path / "other"), reports_path)
+        .get_sheet("utrc_corral_usage")
+        .columns,
+    )
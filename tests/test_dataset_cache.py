@@ -0,0 +1,113 @@
+import json
+import os
+
+import pandas as pd
+
+import src.dataset_cache
+from src.data_functions import merge_workbooks, parse_workbooks
+from src.dataset_cache import (
+    fingerprint_workbooks,
+    get_workbook_fingerprint,
+    ingest_workbooks,
+    load_dataset,
+    write_artifact,
+)
+from tests.conftest import WORKSHEETS, write_report
+
+
+def test_get_workbook_fingerprint(reports_path):
+    path = os.path.join(reports_path, "utrc_report_2023-01-01_to_2023-02-01.xlsx")
+    t1 = get_workbook_fingerprint(path)
+    assert t1["size"] == os.path.getsize(path)
+    assert len(t1["sha256"]) == 64
+
+    # the hash is not recomputed when size and mtime are unchanged
+    t2 = get_workbook_fingerprint(path, {**t1, "sha256": "reused"})
+    assert t2["sha256"] == "reused"
+
+
+def test_load_dataset(reports_path, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    t1 = load_dataset(WORKSHEETS, cache_dir, reports_path)
+    assert t1["utrc_individual_user_hpc_usage"].shape[0] == 5
+    assert t1["utrc_corral_usage"]["Storage Granted (TB)"].tolist() == [2.0, 2.0]
+
+    parsed = []
+
+    def record_parse(paths, WORKSHEETS, workers):
+        parsed.extend(path.split("/")[-1] for path in paths)
+        return parse_workbooks(paths, WORKSHEETS, workers)
+
+    monkeypatch.setattr(src.dataset_cache, "parse_workbooks", record_parse)
+
+    # a restart with no new reports is served from the cache
+    t2 = load_dataset(WORKSHEETS, cache_dir, reports_path)
+    for sheet in WORKSHEETS:
+        pd.testing.assert_frame_equal(t1[sheet], t2[sheet])
+
+    # touching a workbook without changing its contents keeps the cache valid
+    path = os.path.join(reports_path, "utrc_report_2023-01-01_to_2023-02-01.xlsx")
+    os.utime(path, ns=(0, 0))
+    load_dataset(WORKSHEETS, cache_dir, reports_path)
+    assert parsed == []
+
+    # only the new report is parsed
+    write_report(reports_path, "2023-03-01", "2023-04-01", ["d"])
+    assert len(fingerprint_workbooks(reports_path)) == 3
+    t3 = load_dataset(WORKSHEETS, cache_dir, reports_path)
+    assert parsed == ["utrc_report_2023-03-01_to_2023-04-01.xlsx"]
+    assert t3["utrc_individual_user_hpc_usage"]["Date"].tolist() == [
+        "23-01",
+        "23-01",
+        "23-02",
+        "23-02",
+        "23-02",
+        "23-03",
+    ]
+
+    # removed reports are dropped without parsing anything
+    os.remove(path)
+    t4 = load_dataset(WORKSHEETS, cache_dir, reports_path)
+    assert len(parsed) == 1
+    assert t4["utrc_individual_user_hpc_usage"].shape[0] == 4
+
+
+def test_load_dataset_matches_merge_workbooks(reports_path, tmp_path):
+    r1 = merge_workbooks(WORKSHEETS, reports_path)
+    t1 = load_dataset(WORKSHEETS, str(tmp_path / "cache"), reports_path)
+    for sheet in WORKSHEETS:
+        pd.testing.assert_frame_equal(
+            t1[sheet].sort_values(["Date", "Institution"]),
+            r1[sheet].sort_values(["Date", "Institution"]),
+        )
+
+
+def test_load_dataset_persists_institution_aliases(reports_path, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    write_report(
+        reports_path, "2023-03-01", "2023-04-01", ["d"], "Univ of Texas at Dalas"
+    )
+    t1 = load_dataset(WORKSHEETS, cache_dir, reports_path)
+    assert t1["utrc_individual_user_hpc_usage"]["Institution"].tolist()[-1] == "UTD"
+    with open(os.path.join(cache_dir, "institution_aliases.json")) as f:
+        assert json.load(f)["Univ of Texas at Dalas"] == "UTD"
+
+
+def test_load_dataset_from_artifact(reports_path, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    t1 = load_dataset(WORKSHEETS, cache_dir, reports_path)
+    write_artifact(cache_dir, ingest_workbooks(WORKSHEETS, cache_dir, reports_path))
+
+    def fail_ingest(*args):
+        raise AssertionError("the artifact should be loaded without ingesting")
+
+    monkeypatch.setattr(src.dataset_cache, "ingest_workbooks", fail_ingest)
+    t2 = load_dataset(WORKSHEETS, cache_dir, reports_path)
+    for sheet in WORKSHEETS:
+        pd.testing.assert_frame_equal(t1[sheet], t2[sheet])
+
+    # an artifact built from other reports is ignored
+    monkeypatch.undo()
+    write_report(reports_path, "2023-03-01", "2023-04-01", ["d"])
+    t3 = load_dataset(WORKSHEETS, cache_dir, reports_path)
+    assert t3["utrc_individual_user_hpc_usage"].shape[0] == 6
@@ -0,0 +1,22 @@
+import os
+
+import pandas as pd
+
+from src.dataset_cache import read_artifact_manifest, read_dataset_worksheet
+from src.ingest import main
+from tests.conftest import WORKSHEETS
+
+
+def test_main(reports_path, tmp_path, monkeypatch):
+    monkeypatch.setattr("src.ingest.WORKSHEETS", WORKSHEETS)
+    cache_dir = str(tmp_path / "cache")
+    args = ["--reports-path", reports_path, "--cache-dir", cache_dir, "--workers", "1"]
+    assert main(args) == 0
+    manifest = read_artifact_manifest(WORKSHEETS, cache_dir, reports_path)
+    t1 = read_dataset_worksheet(cache_dir, manifest, "utrc_individual_user_hpc_usage")
+    assert t1.shape[0] == 5
+
+    # a report missing a worksheet fails the build
+    path = os.path.join(reports_path, "utrc_report_2023-03-01_to_2023-04-01.xlsx")
+    pd.DataFrame({"login": ["d"]}).to_excel(path, sheet_name="other", index=False)
+    assert main(args) == 1
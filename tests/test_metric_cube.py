@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data_functions import (
+    calc_corral_monthly_sums_with_peaks,
+    calc_monthly_avgs,
+    calc_node_monthly_sums,
+    calc_node_monthly_sums_no_machine,
+    filter_df,
+    get_allocation_totals,
+    get_totals,
+)
+from src.metric_cube import (
+    MetricTensor,
+    build_cube,
+    calc_cube_corral_monthly_sums_with_peaks,
+    calc_cube_monthly_avgs,
+    calc_cube_monthly_counts,
+    calc_cube_node_monthly_sums,
+    calc_cube_node_monthly_sums_no_machine,
+    calc_range_total,
+    get_summary_totals,
+)
+
+INSTITUTIONS = ["UTAus", "UTA", "UTD", "UTEP"]
+MACHINES = ["Lonestar6", "Frontera", "Stampede3"]
+DATES = ["23-01", "23-02", "23-03", "23-04"]
+
+
+def make_sheet(rows, seed):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        {
+            "Institution": rng.choice(INSTITUTIONS, rows),
+            "Resource": rng.choice(MACHINES, rows),
+            "Login": [f"user{i}" for i in range(rows)],
+            "SU's Charged": rng.random(rows) * 1000,
+            "Storage Granted (TB)": rng.random(rows) * 10,
+            "Idle Allocation?": rng.choice(["X", None], rows),
+            "Date": rng.choice(DATES, rows),
+        }
+    )
+    for col in ["Institution", "Resource", "Date"]:
+        df[col] = df[col].astype("category")
+    return df
+
+
+class CubeDataset:
+    def __init__(self, sheets):
+        self.sheets = sheets
+
+    def __getitem__(self, sheet):
+        return self.sheets[sheet]
+
+    def get_tensor(self, sheet):
+        return MetricTensor(build_cube(self.sheets[sheet]))
+
+
+@pytest.fixture
+def dataset():
+    return CubeDataset(
+        {
+            "utrc_individual_user_hpc_usage": make_sheet(300, 1),
+            "utrc_idle_users": make_sheet(100, 2),
+            "utrc_active_allocations": make_sheet(200, 3),
+            "utrc_current_allocations": make_sheet(200, 4),
+        }
+    )
+
+
+FILTERS = [
+    (INSTITUTIONS, DATES, MACHINES),
+    (["UTD", "UTAus"], DATES[1:3], ["Frontera", "Lonestar6"]),
+    (["UTEP"], DATES[:1], ["Stampede3"]),
+    (["UTSW"], DATES, MACHINES),
+    (["UTA", "UTA"], [DATES[0], DATES[3]], MACHINES),
+]
+
+
+def test_build_cube():
+    df = make_sheet(50, 0)
+    cube = build_cube(df)
+    assert cube["Count"].sum() == 50
+    assert cube["Idle Count"].sum() == (df["Idle Allocation?"] == "X").sum()
+    assert cube["SU's Charged"].sum() == pytest.approx(df["SU's Charged"].sum())
+    assert not cube.duplicated(["Institution", "Resource", "Date"]).any()
+
+
+def test_metric_tensor():
+    df = make_sheet(50, 0)
+    tensor = MetricTensor(build_cube(df))
+    assert tensor.values["Count"].shape == (4, 3, 4)
+    assert tensor.values["Count"].sum() == 50
+    # prefix sums give the same totals as summing the months
+    selection = tensor.select(["UTD", "UTA"], DATES[1:], MACHINES[:2])
+    np.testing.assert_allclose(
+        tensor.range_total("SU's Charged", selection),
+        tensor.slice("SU's Charged", selection).sum(axis=(1, 2)),
+    )
+
+
+@pytest.mark.parametrize("institutions,dates,machines", FILTERS)
+def test_cube_charts_match_raw_rows(dataset, institutions, dates, machines):
+    df = dataset["utrc_active_allocations"]
+    raw = filter_df(df, institutions, dates, machines)
+    tensor = MetricTensor(build_cube(df))
+    args = (institutions, dates, machines)
+
+    pd.testing.assert_frame_equal(
+        calc_cube_monthly_avgs(tensor, *args),
+        calc_monthly_avgs(raw, institutions),
+    )
+    pd.testing.assert_frame_equal(
+        calc_cube_node_monthly_sums(tensor, *args),
+        calc_node_monthly_sums(raw, institutions),
+    )
+    pd.testing.assert_frame_equal(
+        calc_cube_corral_monthly_sums_with_peaks(tensor, *args),
+        calc_corral_monthly_sums_with_peaks(raw, institutions),
+    )
+    no_machine = filter_df(df, [institutions[0]], dates, machines)
+    pd.testing.assert_frame_equal(
+        calc_cube_node_monthly_sums_no_machine(
+            tensor, institutions[0], dates, machines
+        ),
+        calc_node_monthly_sums_no_machine(no_machine, institutions[0]),
+    )
+    assert calc_range_total(tensor, "SU's Charged", *args) == pytest.approx(
+        raw["SU's Charged"].sum()
+    )
+
+
+@pytest.mark.parametrize("institutions,dates,machines", FILTERS)
+def test_cube_monthly_counts_match_raw_rows(dataset, institutions, dates, machines):
+    df = dataset["utrc_individual_user_hpc_usage"]
+    raw = filter_df(df, institutions, dates, machines)
+    t1 = calc_cube_monthly_counts(
+        MetricTensor(build_cube(df)), institutions, dates, machines
+    )
+    # the rows and AVG rows the Users chart counted before it was a bar chart
+    monthly = raw.groupby(["Institution", "Date"]).size()
+    for inst in set(institutions) & set(raw["Institution"]):
+        rows = t1[t1["Institution"] == inst].set_index("Date")["Count"]
+        assert rows.drop("AVG").to_dict() == monthly[inst].to_dict()
+        dates_present = raw["Date"][raw["Institution"] == inst]
+        assert rows["AVG"] == int(dates_present.value_counts().mean())
+    assert set(t1["Institution"]) == set(institutions) & set(raw["Institution"])
+
+
+@pytest.mark.parametrize("institutions,dates,machines", FILTERS)
+def test_cube_totals_match_raw_rows(dataset, institutions, dates, machines):
+    filters = (institutions, dates, machines)
+    users = ["utrc_individual_user_hpc_usage", "utrc_idle_users"]
+    assert get_summary_totals(
+        dataset, ["active_users", "idle_users"], *filters
+    ) == get_totals(dataset, institutions, dates, users, machines)
+
+    allocations = ["utrc_active_allocations", "utrc_current_allocations"]
+    assert get_summary_totals(
+        dataset, ["active_allocations", "idle_allocations"], *filters
+    ) == get_allocation_totals(dataset, institutions, dates, allocations, machines)
@@ -0,0 +1,86 @@
+import pickle
+
+import pandas as pd
+
+from src.query_cache import QueryCache, SharedCache, format_stats, normalize_filters
+
+
+def test_normalize_filters():
+    t1 = normalize_filters(["UTD", "UTA", "UTD"], ["23-02", "23-01"], ["b", "a", "a"])
+    assert t1 == (("UTA", "UTD"), ("23-01", "23-02"), ("a", "b"))
+
+
+def test_query_cache():
+    df = pd.DataFrame({"a": range(100)})
+    size = df.memory_usage(index=True, deep=True).sum()
+    cache = QueryCache(int(size * 2.5))
+    calls = []
+
+    def compute(key):
+        calls.append(key)
+        return df.copy()
+
+    t1 = cache.get("a", lambda: compute("a"))
+    assert cache.get("a", lambda: compute("a")) is t1
+    cache.get("b", lambda: compute("b"))
+    cache.get("a", lambda: compute("a"))
+    # the least recently used entry makes room for the third
+    cache.get("c", lambda: compute("c"))
+    cache.get("a", lambda: compute("a"))
+    cache.get("b", lambda: compute("b"))
+    assert calls == ["a", "b", "c", "b"]
+    assert cache.stats() == {
+        "hits": 3,
+        "shared_hits": 0,
+        "misses": 4,
+        "evictions": 2,
+        "entries": 2,
+        "bytes": size * 2,
+        "max_bytes": int(size * 2.5),
+    }
+
+    # results larger than the budget are not kept
+    big = pd.DataFrame({"a": range(1000)})
+    assert cache.get("big", lambda: big) is big
+    assert cache.stats()["entries"] == 2
+
+
+def test_shared_cache(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    df = pd.DataFrame({"a": range(100)})
+    t1 = QueryCache(1024 * 1024, SharedCache(path, 1024 * 1024))
+    t2 = QueryCache(1024 * 1024, SharedCache(path, 1024 * 1024))
+    t1.retain("v1")
+    t1.get(("v1", "a"), lambda: df)
+    # another worker reads the result instead of computing it
+    t3 = t2.get(("v1", "a"), lambda: None)
+    pd.testing.assert_frame_equal(t3, df)
+    assert t2.stats()["shared_hits"] == 1
+    assert t2.stats()["shared_entries"] == 1
+
+    # only the results of the retained version are kept
+    t2.get(("v2", "a"), lambda: df)
+    t2.retain("v2")
+    assert t1.shared.stats()["shared_entries"] == 1
+    assert t1.shared.get(repr(("v1", "a"))) is None
+    # a worker that has not reloaded yet keeps the newer results
+    t1.get(("v1", "b"), lambda: df)
+    t1.retain("v1")
+    assert t1.shared.get(repr(("v2", "a"))) is not None
+    t2.retain("v2")
+    assert t1.shared.get(repr(("v1", "b"))) is None
+
+    # the least recently used results make room for new ones
+    shared = SharedCache(path, len(pickle.dumps(df)) * 2)
+    shared.put("v2", "b", pickle.dumps(df))
+    shared.put("v2", "c", pickle.dumps(df))
+    assert shared.get("('v2', 'a')") is None
+    assert shared.stats()["shared_entries"] == 2
+    # results larger than the whole cache are not written
+    shared.put("v2", "d", pickle.dumps(pd.DataFrame({"a": range(1000)})))
+    assert shared.get("d") is None
+
+
+def test_format_stats():
+    t1 = format_stats({"hits": 3, "bytes": 10}, 42)
+    assert t1 == 'query_cache_hits_total{pid="42"} 3\nquery_cache_bytes{pid="42"} 10\n'
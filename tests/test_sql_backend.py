@@ -0,0 +1,36 @@
+import pandas as pd
+import pytest
+
+from src.data_functions import filter_df
+from src.sql_backend import SqlBackend
+from tests.test_metric_cube import DATES, FILTERS, make_sheet
+
+SHEETS = {
+    "utrc_individual_user_hpc_usage": make_sheet(300, 1),
+    "utrc_idle_users": make_sheet(100, 2).drop(columns="Resource"),
+    "utrc_active_allocations": make_sheet(200, 3),
+    "utrc_current_allocations": make_sheet(200, 4),
+}
+
+
+@pytest.fixture
+def backend():
+    return SqlBackend(SHEETS.__getitem__)
+
+
+@pytest.mark.parametrize("institutions,dates,machines", FILTERS)
+def test_filter_df(backend, institutions, dates, machines):
+    for sheet, df in SHEETS.items():
+        pd.testing.assert_frame_equal(
+            backend.filter_df(sheet, institutions, dates, machines),
+            filter_df(df, institutions, dates, machines),
+        )
+
+
+def test_filter_df_missing_values():
+    df = make_sheet(50, 5)
+    df.loc[:9, "Institution"] = None
+    backend = SqlBackend(lambda sheet: df)
+    args = (["UTA", "UTD"], DATES, ["Frontera"])
+    t1 = backend.filter_df("sheet", *args)
+    pd.testing.assert_frame_equal(t1, filter_df(df, *args))
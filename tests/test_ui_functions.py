@@ -4,19 +4,22 @@ import pandas as pd
 import plotly
 import plotly.express as px
 import pytest
-from dash import dash_table, dcc, html
+from dash import dash_table, dcc, html, no_update
 
 from src.data_functions import create_fy_options, get_all_months
 from src.ui_functions import (
     create_conditional_style,
+    get_table_page,
     get_table_styles,
     make_bar_graph,
+    make_bar_graph_comparison,
     make_color_map,
     make_data_table,
     make_date_dd,
     make_df_download_button,
     make_filters,
     make_summary_panel,
+    selects_all,
 )
 from src.constants import MACHINES_MENU, INSTITUTIONS_MENU
 
@@ -102,14 +105,19 @@ def test_make_data_table():
         data=df.to_dict("records"),
         columns=[{"name": i, "id": i} for i in df.columns],
         fixed_rows={"headers": True},
+        page_action="custom",
+        page_current=0,
         page_size=200,
+        page_count=1,
         style_header=styles["style_header"],
         style_cell=styles["style_cell"],
         style_data_conditional=styles["style_data_conditional"],
         style_cell_conditional=create_conditional_style(df),
         style_header_conditional=styles["style_header_conditional"],
-        sort_action="native",
-        filter_action="native",
+        sort_action="custom",
+        sort_by=[],
+        filter_action="custom",
+        filter_query="",
         style_as_list_view=True,
     )
     t1 = make_data_table(df)
@@ -117,26 +125,22 @@ def test_make_data_table():
     t1obj = json.loads(json.dumps(t1, cls=plotly.utils.PlotlyJSONEncoder))
     assert r1obj == t1obj
 
-    r2 = dash_table.DataTable(
-        id="datatable_id",
-        data=df.to_dict("records"),
-        columns=[{"name": i, "id": i} for i in df.columns],
-        fixed_rows={"headers": True},
-        page_size=200,
-        style_header=styles["style_header"],
-        style_cell=styles["style_cell"],
-        style_data_conditional=styles["style_data_conditional"],
-        style_cell_conditional=create_conditional_style(df),
-        style_header_conditional=styles["style_header_conditional"],
-        sort_action="native",
-        sort_by="col2",
-        filter_action="native",
-        style_as_list_view=True,
-    )
-    t2 = make_data_table(df, "col2")
-    r2obj = json.loads(json.dumps(r2, cls=plotly.utils.PlotlyJSONEncoder))
-    t2obj = json.loads(json.dumps(t2, cls=plotly.utils.PlotlyJSONEncoder))
-    assert r2obj == t2obj
+    # the first page is sorted as sort_by asks
+    sort_by = [{"column_id": "col2", "direction": "asc"}]
+    t2 = make_data_table(df, sort_by, "users-datatable")
+    assert t2.id == "users-datatable"
+    assert t2.sort_by == sort_by
+    assert [row["col2"] for row in t2.data] == list(range(7))
+
+
+def test_get_table_page():
+    df = pd.DataFrame({"col1": range(450)})
+    t1, count = get_table_page(df)
+    assert count == 3
+    assert t1 == [{"col1": x} for x in range(200)]
+    t2, count = get_table_page(df, 2)
+    assert t2 == [{"col1": x} for x in range(400, 450)]
+    assert get_table_page(df.iloc[:0]) == ([], 1)
 
 
 def test_make_color_map():
@@ -167,13 +171,14 @@ def test_make_bar_graph():
             "UTSYS",
         ]
     }
+    # dates outside months1 take the next template color, as in plotly express
     months1 = ["23-01", "23-02", "23-03"]
     colors1 = make_color_map(months1)
 
     # Allocations Page
     d1 = {
         "Institution": [x for x in range(7)],
-        "Date": [x for x in range(6, -1, -1)],
+        "Date": [f"23-{x + 1:02d}" for x in range(6, -1, -1)],
         "Resource": [0 for x in range(7)],
         "Count": [0 for x in range(7)],
     }
@@ -210,7 +215,7 @@ def test_make_bar_graph():
     d2 = {
         "Institution": [x for x in range(7)],
         "Resource": [0 for x in range(7)],
-        "Date": [x for x in range(6, -1, -1)],
+        "Date": [f"23-{x + 1:02d}" for x in range(6, -1, -1)],
         "SU's Charged": [0 for x in range(7)],
     }
     df2 = pd.DataFrame(data=d2)
@@ -242,7 +247,7 @@ def test_make_bar_graph():
 
     d3 = {
         "Institution": [x for x in range(7)],
-        "Date": [x for x in range(6, -1, -1)],
+        "Date": [f"23-{x + 1:02d}" for x in range(6, -1, -1)],
         "Storage Granted (TB)": [0 for x in range(7)],
     }
     df3 = pd.DataFrame(data=d3)
@@ -306,6 +311,79 @@ def test_make_bar_graph():
     assert r4obj == t4obj
 
 
+def apply_patch(obj, patch):
+    for op in patch.to_plotly_json()["operations"]:
+        *path, last = op["location"]
+        target = obj
+        for key in path:
+            target = target[key]
+        if op["operation"] == "Assign":
+            target[last] = op["params"]["value"]
+        elif op["operation"] == "Delete":
+            del target[last]
+        else:
+            target[last].insert(op["params"]["index"], op["params"]["value"])
+    return obj
+
+
+def to_json(component):
+    return json.loads(json.dumps(component, cls=plotly.utils.PlotlyJSONEncoder))
+
+
+@pytest.mark.parametrize(
+    "shown,dates",
+    [
+        # a month added at the end and one institution dropped
+        ((["UTA", "UTD"], ["23-01", "23-02"]), (["UTA"], ["23-01", "23-02", "23-03"])),
+        # months removed from the start and middle
+        ((["UTA"], ["23-01", "23-02", "23-03"]), (["UTA", "UTD"], ["23-02"])),
+        # nothing changed
+        ((["UTA", "UTD"], ["23-01"]), (["UTA", "UTD"], ["23-01"])),
+    ],
+)
+def test_make_bar_graph_patch(shown, dates):
+    def make_df(institutions, months):
+        return pd.DataFrame(
+            {
+                "Institution": [i for _ in months for i in institutions],
+                "Date": [m for m in months for _ in institutions],
+                "Count": range(len(institutions) * len(months)),
+            }
+        )
+
+    previous = (make_df(*shown), shown[1])
+    t1 = make_bar_graph(make_df(*dates), "Title", dates[1], "Count", previous=previous)
+    if shown == dates:
+        assert t1 is no_update
+        return
+    r1 = make_bar_graph(make_df(*dates), "Title", dates[1], "Count")
+    card = to_json(make_bar_graph(previous[0], "Title", shown[1], "Count"))
+    assert apply_patch(card, t1) == to_json(r1)
+
+
+def test_make_bar_graph_comparison():
+    dfs = [
+        pd.DataFrame({"Month Name": ["Sep", "Oct", "Sep"], "Count": [1, 2, 3]}),
+        pd.DataFrame({"Month Name": ["Oct"], "Count": [4]}),
+    ]
+    # rows are counted per month in order of appearance
+    t1 = make_bar_graph_comparison(dfs, ["a", "b"], "Month", "Count")
+    assert [(t["x"], t["y"]) for t in t1["data"]] == [
+        (["Sep", "Oct"], [2, 1]),
+        (["Oct"], [1]),
+    ]
+    assert t1["layout"]["bargap"] == 0
+    t2 = make_bar_graph_comparison(dfs, ["a", "b"], "Month", "Count", "Bar")
+    assert t2["data"][0]["y"] == [1, 2, 3]
+    assert "bargap" not in t2["layout"]
+
+
+def test_selects_all():
+    assert selects_all(["UTA"], ["All"])
+    assert selects_all(["All", "UTA"])
+    assert not selects_all(["UTA"], [], None)
+
+
 def test_make_date_dd():
     dates = get_all_months()
     r1 = dcc.Dropdown(